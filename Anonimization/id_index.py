@@ -0,0 +1,108 @@
+import logging
+from collections import Counter
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class PatientIDIndex:
+    """
+    Maps patient IDs to their UnifiedPatientID through a dict, built once from the mapping csv.
+    IDs that occur more than once in the mapping are ambiguous and never mapped, IDs without a
+    UnifiedPatientID are gaps. Both are reported when the index is built, the IDs that could not
+    be mapped during the run are reported together by `log_summary`.
+    """
+
+    def __init__(
+        self, mapping: pd.DataFrame, key="PatientID", value="UnifiedPatientID"
+    ):
+        """
+        Args:
+            mapping (pd.DataFrame): The mapping, with the `key` and `value` columns.
+            key (str): Column of the IDs to look up.
+            value (str): Column of the IDs they are mapped to.
+        """
+        mapping = mapping[[key, value]].dropna(subset=[key])
+        counts = mapping[key].value_counts()
+        self.ambiguous = set(counts.index[counts > 1])
+        unique = mapping[~mapping[key].isin(self.ambiguous)]
+        self.gaps = set(unique.loc[unique[value].isna(), key])
+        unique = unique.dropna(subset=[value])
+        self._index = dict(zip(unique[key], unique[value]))
+
+        self.hits = 0
+        self.missing = Counter()
+        self.ambiguous_lookups = Counter()
+        if self.ambiguous:
+            logger.error(
+                f"{len(self.ambiguous)} patient IDs occur more than once in the mapping and "
+                f"will be skipped: {sorted(self.ambiguous)}"
+            )
+        if self.gaps:
+            logger.error(
+                f"{len(self.gaps)} patient IDs have no {value} in the mapping and will be "
+                f"skipped: {sorted(self.gaps)}"
+            )
+
+    @classmethod
+    def from_csv(cls, path, key="PatientID", value="UnifiedPatientID"):
+        """
+        Builds the index from the mapping csv, the IDs are read as strings so they compare
+        equal to the IDs in the xml and dicom files.
+        """
+        mapping = pd.read_csv(path, usecols=[key, value], dtype=str)
+        return cls(mapping, key, value)
+
+    def __len__(self):
+        return len(self._index)
+
+    def resolve(self, pid) -> tuple:
+        """
+        Looks up `pid` without updating the statistics, so the index can be shared read-only
+        with worker processes. The outcome is counted in the parent through `record`.
+        Returns:
+            tuple: A tuple containing:
+                - new_id (str | None): The UnifiedPatientID, None when `pid` is not mapped.
+                - status (str): "hit", "missing" or "ambiguous".
+        """
+        new_id = self._index.get(pid)
+        if new_id is not None:
+            return new_id, "hit"
+        return None, "ambiguous" if pid in self.ambiguous else "missing"
+
+    def record(self, pid, status):
+        """
+        Counts the outcome of a `resolve`.
+        """
+        if status == "hit":
+            self.hits += 1
+        elif status == "ambiguous":
+            self.ambiguous_lookups[pid] += 1
+        else:
+            self.missing[pid] += 1
+
+    def lookup(self, pid):
+        """
+        Returns the UnifiedPatientID of `pid`, or None when it is missing or ambiguous.
+        """
+        new_id, status = self.resolve(pid)
+        self.record(pid, status)
+        return new_id
+
+    def log_summary(self):
+        """
+        Logs how many lookups succeeded and which IDs were skipped, with their number of files.
+        """
+        logger.info(
+            f"Mapped {self.hits} files, skipped {sum(self.missing.values())} files of "
+            f"{len(self.missing)} unknown patients and "
+            f"{sum(self.ambiguous_lookups.values())} files of "
+            f"{len(self.ambiguous_lookups)} ambiguous patients"
+        )
+        if self.missing:
+            logger.error(f"Could not find patients: {dict(sorted(self.missing.items()))}")
+        if self.ambiguous_lookups:
+            logger.error(
+                f"Multiple patients found for: {dict(sorted(self.ambiguous_lookups.items()))}"
+            )
@@ -1,12 +1,30 @@
 import glob
+import hashlib
 import logging
-import pandas as pd
 import pydicom
 import os
 import argparse
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm
 import datetime
 
+from id_index import PatientIDIndex
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "scrub_manifest.tsv"
+# the manifest is synced to disk after this many files or seconds, a crash in between only
+# means those files are scrubbed again
+_MANIFEST_SYNC_FILES = 1000
+_MANIFEST_SYNC_SECONDS = 10.0
+
+# patient ID index of a worker process, set once by _init_worker
+_index = None
+
 
 def remove_UIDs(ds: pydicom.dataset.FileDataset) -> pydicom.dataset.FileDataset:
     ds.SOPClassUID = ""
@@ -38,65 +56,20 @@ def remove_acquisition_time(
     return ds
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "-p", "--abs_path", type=str, help="Path to the dicom files folder"
-    )
-    parser.add_argument(
-        "--csv",
-        type=str,
-        help="Path to the csv file containing the mapping between patient names and unique_ids",
-    )
-    parser.add_argument("--out_path", type=str, help="Path to the output folder")
-
-    args = parser.parse_args()
-
-    logger = logging.getLogger(__name__)
-    logging.basicConfig(
-        filename=os.path.join(args.out_path, "scrub_dicom_files.log"),
-        encoding="utf-8",
-        level=logging.DEBUG,
-        format="%(asctime)s %(message)s",
-    )
-
-    df = pd.read_csv(args.csv)
-
-    assert os.path.exists(args.abs_path)
-    files = glob.glob(os.path.join(args.abs_path, "**", "*.dcm"), recursive=True)
- 
-    for f in tqdm(files, mininterval=10):
+def _scrub_to_temp(f: str, out_path: str, index: PatientIDIndex, header_only=False) -> tuple:
+    # de-identifies `f` into a unique temporary file next to its output, see `scrub_file`
+    with open(f, "rb") as src:
         try:
-            ds = pydicom.dcmread(f)
+            ds = pydicom.dcmread(src, stop_before_pixels=header_only)
         except pydicom.errors.InvalidDicomError as e:
-            logger.error(f"Error reading {f} {e}, skipping")
-            continue
-
-        family_name = ds.PatientName.family_name
-        given_name = ds.PatientName.given_name
-        birthdate = datetime.datetime.strptime(ds.PatientBirthDate, "%Y%m%d").strftime(
-            "%Y-%m-%d"
-        )
-        # dit is stom, gebruik PatientId -> UnifiedPatientID ipv (FamilyName, GivenName, BirthDate) -> UnifiedPatientID
-        # new_id = df[
-        #     (df.FamilyName == family_name)
-        #     & (df.GivenName == given_name)
-        #     & (df.PatientBirthDate == birthdate)
-        # ].UnifiedPatientID
-
-        new_id = df[df.PatientID == ds.PatientID].UnifiedPatientID
-
-        if new_id.empty:
-            logger.error(
-                f"Could not find patient {family_name} {given_name} {birthdate}, skipping"
-            )
-            continue
-        elif len(new_id) > 1:
-            logger.error(
-                f"Multiple patients found for {family_name} {given_name} {birthdate}, skipping"
-            )
-            continue
-        new_id = new_id.iloc[0]
+            return None, None, f"Error reading {f} {e}, skipping", None
+        # dcmread stops at the start of the pixel data element, or at the end of the file
+        pixel_offset = src.tell()
+
+        pid = ds.PatientID
+        new_id, status = index.resolve(pid)
+        if new_id is None:  # reported by index.log_summary
+            return None, None, None, (pid, status)
         sdate = ds.StudyDate
 
         ds.PatientName = pydicom.valuerep.PersonName("")
@@ -118,8 +91,242 @@ if __name__ == "__main__":
         name_parts = fname.split("_")[-3:]
         name_parts.insert(0, sdate)
         new_name = "_".join(name_parts)
-        new_path = os.path.join(args.out_path, new_id, new_name)
+        new_path = os.path.join(out_path, new_id, new_name)
         os.makedirs(os.path.dirname(new_path), exist_ok=True)
-        ds.save_as(
-            new_path
-        )  # same as pydicom.filewriter.dcmwrite(new_path,ds,write_like_original=True)
+        tmp_path = f"{new_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, "xb") as dst:
+                ds.save_as(
+                    dst
+                )  # same as pydicom.filewriter.dcmwrite(new_path,ds,write_like_original=True)
+                if header_only:
+                    src.seek(pixel_offset)
+                    shutil.copyfileobj(src, dst, 16 * 1024**2)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, new_path, None, (pid, status)
+
+
+def scrub_file(
+    f: str, out_path: str, index: PatientIDIndex, header_only=False
+) -> tuple:
+    """
+    De-identifies a single dicom file and writes it to `out_path`/<UnifiedPatientID>/.
+    The file is written under a unique temporary name first, so an interrupted run never leaves
+    a truncated output behind. An existing output with the same name is replaced, see
+    `scrub_files` for how several inputs with the same output name are kept apart.
+    Args:
+        f (str): The dicom file.
+        out_path (str): The output folder.
+        index (PatientIDIndex): Mapping between PatientID and UnifiedPatientID, only read.
+        header_only (bool): Only parse the header. The pixel data element, and anything after
+                            it, is copied byte for byte from `f` to the output in blocks, so
+                            memory use does not grow with the size of the volume.
+    Returns:
+        tuple: A tuple containing:
+            - new_path (str | None): The written file, None when the file was skipped.
+            - error (str | None): Why the file was skipped, None when it was only skipped
+              because its patient is not mapped.
+            - lookup (tuple | None): The PatientID and status of its `index.resolve`, to be
+              counted by `index.record`.
+    """
+    tmp_path, new_path, error, lookup = _scrub_to_temp(f, out_path, index, header_only)
+    if tmp_path is not None:
+        os.replace(tmp_path, new_path)
+    return new_path, error, lookup
+
+
+def _disambiguate(new_path, f):
+    # the same input always gets the same name, whatever the order the files are scrubbed in
+    stem, ext = os.path.splitext(new_path)
+    digest = hashlib.sha1(os.path.abspath(f).encode("utf-8")).hexdigest()[:8]
+    return f"{stem}_{digest}{ext}"
+
+
+def _init_worker(index):
+    global _index
+    _index = index
+
+
+def _scrub_task(f, out_path, header_only=False):
+    # runs in a worker, failures are reported to the parent instead of ending the run
+    try:
+        tmp_path, new_path, error, lookup = _scrub_to_temp(f, out_path, _index, header_only)
+    except Exception as e:
+        tmp_path, new_path = None, None
+        error, lookup = f"Error scrubbing {f} {e!r}, skipping", None
+    return f, tmp_path, new_path, error, lookup, os.path.getsize(f)
+
+
+def read_manifest(manifest_path) -> dict:
+    """
+    Returns the input files that were scrubbed by an earlier run and whose output still exists,
+    as a dict input -> output.
+    """
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line in manifest:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) == 2 and os.path.exists(parts[1]):  # skips a torn last line
+                done[parts[0]] = parts[1]
+    return done
+
+
+def scrub_files(files, out_path, index, n_workers=1, chunksize=16, header_only=False):
+    """
+    Scrubs the dicom files over a process pool. Every finished file is appended to the manifest
+    in `out_path`, which is synced to disk every `_MANIFEST_SYNC_FILES` files or
+    `_MANIFEST_SYNC_SECONDS` seconds, a rerun skips the files listed there.
+
+    The workers only write temporary files, this process moves them to their output name in
+    the order of `files`. When an input gets the output name of an earlier input (same
+    StudyDate and same last three parts of the file name), it is written next to it with a
+    suffix derived from its input path and a warning is logged, so no output is overwritten
+    and every manifest entry points to the output of its own input. Temporary `.part` files
+    can be left behind when a run is interrupted.
+    Args:
+        files (list of str): The dicom files.
+        out_path (str): The output folder.
+        index (PatientIDIndex): Mapping between PatientID and UnifiedPatientID. Every worker
+                                gets a copy once, the lookups are counted in `index`.
+        n_workers (int | None): Number of worker processes, 1 scrubs serially in this process,
+                                None uses all available cores.
+        chunksize (int): Number of files handed to a worker at once.
+        header_only (bool): Copy the pixel data without loading it, see `scrub_file`.
+    Returns:
+        dict: The number of files "scrubbed", "skipped" and "resumed" (done by an earlier run)
+              and the "seconds" and "bytes" of this run.
+    """
+    manifest_path = os.path.join(out_path, MANIFEST_NAME)
+    done = read_manifest(manifest_path)
+    todo = [f for f in files if f not in done]
+    # output -> input, to detect inputs that end up under the same output name
+    outputs = {new_path: f for f, new_path in done.items()}
+    stats = {"scrubbed": 0, "skipped": 0, "resumed": len(files) - len(todo), "bytes": 0}
+    if stats["resumed"]:
+        logger.info(f"Resuming, {stats['resumed']} files were scrubbed by an earlier run")
+
+    task = partial(_scrub_task, out_path=out_path, header_only=header_only)
+    start = time.perf_counter()
+    last_sync = start
+    unsynced = 0
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        if n_workers == 1:
+            _init_worker(index)
+            executor = None
+            results = map(task, todo)
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker, initargs=(index,)
+            )
+            results = executor.map(task, todo, chunksize=chunksize)
+        try:
+            progress = tqdm(results, total=len(todo), mininterval=10, unit="file")
+            for f, tmp_path, new_path, error, lookup, n_bytes in progress:
+                stats["bytes"] += n_bytes
+                if lookup is not None:
+                    index.record(*lookup)
+                if tmp_path is None:
+                    if error is not None:
+                        logger.error(error)
+                    stats["skipped"] += 1
+                    continue
+                if new_path in outputs:
+                    unique_path = _disambiguate(new_path, f)
+                    logger.warning(
+                        f"Output {new_path} of {f} was already written for "
+                        f"{outputs[new_path]}, writing it to {unique_path}"
+                    )
+                    new_path = unique_path
+                os.replace(tmp_path, new_path)
+                outputs[new_path] = f
+                manifest.write(f"{f}\t{new_path}\n")
+                unsynced += 1
+                now = time.perf_counter()
+                if (
+                    unsynced >= _MANIFEST_SYNC_FILES
+                    or now - last_sync >= _MANIFEST_SYNC_SECONDS
+                ):
+                    manifest.flush()
+                    os.fsync(manifest.fileno())
+                    last_sync = now
+                    unsynced = 0
+                stats["scrubbed"] += 1
+                n_files = stats["scrubbed"] + stats["skipped"]
+                if n_files % 1000 == 0:
+                    _log_throughput(n_files, stats["bytes"], time.perf_counter() - start)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            manifest.flush()
+            os.fsync(manifest.fileno())
+    stats["seconds"] = time.perf_counter() - start
+    _log_throughput(stats["scrubbed"] + stats["skipped"], stats["bytes"], stats["seconds"])
+    logger.info(
+        f"Scrubbed {stats['scrubbed']} files, skipped {stats['skipped']}, "
+        f"{stats['resumed']} done by an earlier run"
+    )
+    index.log_summary()
+    return stats
+
+
+def _log_throughput(n_files, n_bytes, seconds):
+    seconds = max(seconds, 1e-9)
+    logger.info(
+        f"{n_files} files in {seconds:.1f} s: {n_files / seconds:.1f} files/s, "
+        f"{n_bytes / 1024**2 / seconds:.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-p", "--abs_path", type=str, help="Path to the dicom files folder"
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        help="Path to the csv file containing the mapping between patient names and unique_ids",
+    )
+    parser.add_argument("--out_path", type=str, help="Path to the output folder")
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, 0 uses all cores",
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=16, help="Files handed to a worker at once"
+    )
+    parser.add_argument(
+        "--header_only",
+        action="store_true",
+        help="Only parse the dicom header and copy the pixel data through unchanged",
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=os.path.join(args.out_path, "scrub_dicom_files.log"),
+        encoding="utf-8",
+        level=logging.DEBUG,
+        format="%(asctime)s %(message)s",
+    )
+
+    assert os.path.exists(args.abs_path)
+    files = glob.glob(os.path.join(args.abs_path, "**", "*.dcm"), recursive=True)
+    files = sorted(files)
+    index = PatientIDIndex.from_csv(args.csv)
+
+    scrub_files(
+        files,
+        args.out_path,
+        index,
+        args.n_workers or None,
+        args.chunksize,
+        args.header_only,
+    )
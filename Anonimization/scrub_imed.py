@@ -5,16 +5,156 @@ import pandas as pd
 import argparse
 import logging
 
+try:
+    import python_calamine  # noqa: F401
+
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    filename="scrub_imed.log",
-    encoding="utf-8",
-    level=logging.DEBUG,
-    format="%(asctime)s %(message)s",
-)
+
+OUTPUT_FORMATS = ["xlsx", "parquet", "csv"]
+# columns of the identification sheet used to match the patients to the mapping
+ID_COLUMNS = ["Patient ID", "Last Name", "First Name", "Birth Date", "Gender"]
+
+
+def read_imed_sheets(imed_path, columns: dict) -> dict:
+    """
+    Reads the given columns of the given sheets of the iMED workbook, the workbook is opened
+    once and other columns are never loaded.
+    Args:
+        imed_path (str): Path to the iMED workbook.
+        columns (dict): Sheet name -> list of the columns to read.
+    Returns:
+        dict: Sheet name -> pd.DataFrame.
+    """
+    sheets = {}
+    with pd.ExcelFile(imed_path, engine=_EXCEL_ENGINE) as workbook:
+        for sheet_name, sheet_columns in columns.items():
+            wanted = set(sheet_columns)
+            sheets[sheet_name] = workbook.parse(
+                sheet_name, usecols=lambda col: col in wanted
+            )
+    return sheets
+
+
+def _to_parquet(df, path):
+    # columns that mix e.g. numbers and strings can not be stored as one Arrow type
+    df = df.copy(deep=False)
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            df[col] = df[col].astype("string")
+    df.to_parquet(path, index=False)
+
+
+def write_imed(imed_df_dict: dict, out_path, formats=("xlsx",)):
+    """
+    Writes the anonymized sheets as anon_imed.xlsx and/or as one anon_imed_<sheet>.parquet or
+    .csv file per sheet. Parquet and csv are much faster to write than xlsx.
+    Args:
+        imed_df_dict (dict): Sheet name -> pd.DataFrame.
+        out_path (str): The output folder.
+        formats (list of str): Any of `OUTPUT_FORMATS`.
+    """
+    unknown = set(formats).difference(OUTPUT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown formats {sorted(unknown)}, expected {OUTPUT_FORMATS}")
+    if "xlsx" in formats:
+        with pd.ExcelWriter(os.path.join(out_path, "anon_imed.xlsx")) as writer:
+            for sheet_name, df in imed_df_dict.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    for sheet_name, df in imed_df_dict.items():
+        path = os.path.join(out_path, f"anon_imed_{sheet_name}")
+        if "parquet" in formats:
+            _to_parquet(df, path + ".parquet")
+        if "csv" in formats:
+            df.to_csv(path + ".csv", index=False)
+
+
+def normalise_mapping(id_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalizes the strings and the birth date of the patient -> unique_id mapping to facilitate
+    the comparison with the iMED identification, see `match_patients`.
+    """
+    id_df = id_df.copy()
+    for column in ["FamilyName", "GivenName", "PatientSex"]:
+        id_df[column] = id_df[column].str.lower()
+    id_df["PatientBirthDate"] = pd.to_datetime(
+        id_df["PatientBirthDate"], format="%Y-%m-%d"
+    )
+    return id_df
+
+
+def normalise_identification(identification: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the `ID_COLUMNS` of the iMED identification sheet, normalized like the mapping by
+    `normalise_mapping`.
+    """
+    imed_id_df = identification[ID_COLUMNS].copy()
+    for column in ["Last Name", "First Name", "Gender"]:
+        imed_id_df[column] = imed_id_df[column].str.lower()
+    imed_id_df["Birth Date"] = pd.to_datetime(
+        imed_id_df["Birth Date"], format="%d.%m.%Y"
+    )
+    return imed_id_df
+
+
+def match_patients(id_df: pd.DataFrame, imed_id_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inner joins the normalized mapping and iMED identification on name, sex and birth date.
+    """
+    return pd.merge(
+        left=id_df,
+        right=imed_id_df,
+        how="inner",
+        left_on=["FamilyName", "GivenName", "PatientSex", "PatientBirthDate"],
+        right_on=["Last Name", "First Name", "Gender", "Birth Date"],
+    )
+
+
+def remap_patient_ids(imed_df_dict: dict, merged_id: pd.DataFrame) -> dict:
+    """
+    Replaces the iMED "Patient ID" of every sheet by its UnifiedPatientID and drops the rows of
+    patients that are not in `merged_id`. The IDs of all sheets are looked up together in one
+    hash lookup against the indexed mapping, instead of a scan of `merged_id` per row.
+    Args:
+        imed_df_dict (dict): Sheet name -> pd.DataFrame with a "Patient ID" column.
+        merged_id (pd.DataFrame): The mapping, with "Patient ID" and "UnifiedPatientID".
+    Returns:
+        dict: Sheet name -> remapped pd.DataFrame, empty sheets are returned unchanged.
+    """
+    # the first match wins, like the former row-wise lookup
+    mapping = merged_id.drop_duplicates(subset="Patient ID")
+    mapping_index = pd.Index(mapping["Patient ID"])
+    unified_ids = mapping["UnifiedPatientID"].to_numpy(dtype=object)
+
+    sheets = {name: df for name, df in imed_df_dict.items() if len(df) > 0}
+    if not sheets:
+        return dict(imed_df_dict)
+    positions = mapping_index.get_indexer(
+        pd.concat([df["Patient ID"] for df in sheets.values()], ignore_index=True)
+    )
+    remapped = dict(imed_df_dict)
+    offset = 0
+    for sheet_name, df in sheets.items():
+        sheet_positions = positions[offset : offset + len(df)]
+        offset += len(df)
+        found = sheet_positions >= 0
+        df = df[found].copy()
+        df["Patient ID"] = unified_ids[sheet_positions[found]]
+        remapped[sheet_name] = df
+    return remapped
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        filename="scrub_imed.log",
+        encoding="utf-8",
+        level=logging.DEBUG,
+        format="%(asctime)s %(message)s",
+    )
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--imed_path", type=str, help="Path to the imed file")
     parser.add_argument(
@@ -27,32 +167,44 @@ if __name__ == "__main__":
         type=str,
         help="Path to the csv file containing the mapping between patient names and unique_ids",
     )
+    parser.add_argument(
+        "--out_path", type=str, default=".", help="Path to the output folder"
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        default=["xlsx"],
+        choices=OUTPUT_FORMATS,
+        help="Output formats, parquet and csv write one file per sheet",
+    )
     args = parser.parse_args()
 
     # read csv containing the mapping between patient names and unique_ids
     id_df = pd.read_csv(args.csv)
-    # normalize the strings and date to facilitate comparison
-    for column in ["FamilyName", "GivenName", "PatientSex"]:
-        id_df.loc[:, column] = id_df.loc[:, column].str.lower()
-    id_df.loc["PatientBirthDate"] = pd.to_datetime(
-        id_df["PatientBirthDate"], format="%Y-%m-%d"
-    )
+    id_df = normalise_mapping(id_df)
     id_df = id_df.drop(
         columns="PatientID"
     )  # drop the 'Canon' patient id to avoid confusion
 
-    # read the imed file
-    imed_df_dict = pd.read_excel(args.imed_path, sheet_name=None)
-    # get patient identification data to campare with the patient -> unique_id mapping
-    imed_id_df = imed_df_dict["Identification"][
-        ["Patient ID", "Last Name", "First Name", "Birth Date", "Gender"]
-    ].copy()
-    for column in ["Last Name", "First Name", "Gender"]:
-        imed_id_df.loc[:, column] = imed_id_df.loc[:, column].str.lower()
-
-    imed_id_df.loc[:, "Birth Date"] = pd.to_datetime(
-        imed_id_df.loc[:, "Birth Date"], format="%d.%m.%Y"
+    # load file containing the columns that should be kept in the imed file, only the header
+    imed_colums_dict = {
+        sheet_name: list(df.columns)
+        for sheet_name, df in pd.read_excel(
+            args.imed_columns_file, sheet_name=None, nrows=0
+        ).items()
+    }
+    # read the imed file, only the kept columns and the ones needed to match the patients
+    read_columns = {
+        sheet_name: ["Patient ID"] + columns
+        for sheet_name, columns in imed_colums_dict.items()
+    }
+    read_columns["Identification"] = ID_COLUMNS + imed_colums_dict.get(
+        "Identification", []
     )
+    imed_df_dict = read_imed_sheets(args.imed_path, read_columns)
+    # get patient identification data to campare with the patient -> unique_id mapping
+    imed_id_df = normalise_identification(imed_df_dict["Identification"])
 
     dupes = imed_id_df.duplicated(
         subset=["Last Name", "First Name", "Gender"], keep=False
@@ -66,13 +218,7 @@ if __name__ == "__main__":
             subset=["Last Name", "First Name", "Gender"]
         )
     # get patientes that are both in the id_df and imed_id_df
-    merged_id = pd.merge(
-        left=id_df,
-        right=imed_id_df,
-        how="inner",
-        left_on=["FamilyName", "GivenName", "PatientSex", "PatientBirthDate"],
-        right_on=["Last Name", "First Name", "Gender", "Birth Date"],
-    )
+    merged_id = match_patients(id_df, imed_id_df)
     assert not merged_id.duplicated(
         subset=["Last Name", "First Name", "Gender"], keep=False
     ).any()
@@ -93,24 +239,14 @@ if __name__ == "__main__":
             "imed_not_in_id.csv", index=False
         )
 
-    for sheet_name, df in imed_df_dict.items():
-        if len(df) == 0:
-            continue
-        df = df[df["Patient ID"].isin(merged_id["Patient ID"])].copy()
-
-        new_ids = df.loc[:, "Patient ID"].apply(
-            lambda x: merged_id.loc[
-                merged_id["Patient ID"] == x, "UnifiedPatientID"
-            ].values[0]
-        )
-        df["Patient ID"] = df["Patient ID"].astype("object")
-        df.loc[:, "Patient ID"] = new_ids
-        imed_df_dict[sheet_name] = df
-
-    # load file containing the columns that should be kept in the imed file
-    imed_colums_dict = pd.read_excel(args.imed_columns_file, sheet_name=None)
-    # write the new anonymous imed file
-    with pd.ExcelWriter("anon_imed.xlsx") as writer:
-        for sheet_name, df in imed_df_dict.items():
-            df = df[imed_colums_dict[sheet_name].columns]  # filter out unneeded columns
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    imed_df_dict = remap_patient_ids(imed_df_dict, merged_id)
+
+    # write the new anonymous imed file, without the columns only read to match the patients
+    write_imed(
+        {
+            sheet_name: imed_df_dict[sheet_name][columns]
+            for sheet_name, columns in imed_colums_dict.items()
+        },
+        args.out_path,
+        args.formats,
+    )
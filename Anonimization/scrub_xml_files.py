@@ -1,12 +1,13 @@
 import os
 
-import pandas as pd
 import glob
 import xml.etree.ElementTree as ET
 import argparse
 import logging
 import datetime
 
+from id_index import PatientIDIndex
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     filename="scrub_xml_files.log",
@@ -16,7 +17,7 @@ logging.basicConfig(
 )
 
 
-def _scrub_xml(tree: ET.ElementTree, df: pd.DataFrame) -> ET.ElementTree | None:
+def _scrub_xml(tree: ET.ElementTree, index: PatientIDIndex) -> ET.ElementTree | None:
     root = tree.getroot()
     pinf = root.find("PatientInformation")
     ex = root.find("ExaminationInformation")
@@ -34,14 +35,10 @@ def _scrub_xml(tree: ET.ElementTree, df: pd.DataFrame) -> ET.ElementTree | None:
         pass
 
     pid = pinf.find("PatientID").text
-    new_id = df[df["PatientID"] == pid]["UnifiedPatientID"]
-    if new_id.empty:
-        logger.error(f"Could not find patient {pid}, skipping")
-        return None
-    elif len(new_id) > 1:
-        logger.error(f"Multiple patients found for {pid}, skipping")
+    new_id = index.lookup(pid)
+    if new_id is None:  # missing and ambiguous patients are reported by index.log_summary
         return None
-    pinf.find("PatientID").text = new_id.values[0]
+    pinf.find("PatientID").text = new_id
 
     return tree
 
@@ -61,14 +58,14 @@ if __name__ == "__main__":
     assert os.path.exists(args.abs_path)
     assert os.path.exists(args.out_path)
     assert os.path.exists(args.csv)
-    df = pd.read_csv(args.csv)
+    index = PatientIDIndex.from_csv(args.csv)
 
     files = glob.glob(os.path.join(args.abs_path, "**", "*.xml"), recursive=True)
     files = sorted(files)
 
     for f in files:
         tree: ET.ElementTree = ET.parse(f)
-        tree = _scrub_xml(tree, df)
+        tree = _scrub_xml(tree, index)
         if tree is None:
             continue
         id = tree.find("PatientInformation").find("PatientID").text
@@ -81,3 +78,5 @@ if __name__ == "__main__":
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
         tree.write(save_path, encoding="utf-8", xml_declaration=True)
+
+    index.log_summary()
@@ -0,0 +1,49 @@
+"""
+Compares building a deduplicated modality frame from one single-row DataFrame per file (the
+old `patient_to_df` path) with the batched `load_data._assemble_frame`, on in-memory records.
+
+    python -m benchmarks.bench_assembly --sizes 10000 100000 1000000 --legacy_max 100000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+import load_data
+from benchmarks import legacy
+from benchmarks.synthetic import synthetic_records
+
+
+def _comparable(df):
+    df = load_data.fix_dtypes(df.reset_index(drop=True))
+    df["ExaminationDate"] = pd.to_datetime(df["ExaminationDate"])
+    df["PatientBirthDate"] = df["PatientBirthDate"].astype("int64")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=100_000,
+        help="Largest size the single-row frame path is run for",
+    )
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        # 6 visits of both eyes per patient, without retakes
+        records = synthetic_records(n // 12, n_visits=6, retake_prob=0.0)
+        start = time.perf_counter()
+        batched = load_data._handle_same_date_scans(load_data._assemble_frame(records))
+        batched_time = time.perf_counter() - start
+        line = f"n={len(records):<9} batched {batched_time:8.2f}s"
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            old = legacy.handle_same_date_scans(legacy.single_row_frames(records))
+            legacy_time = time.perf_counter() - start
+            pd.testing.assert_frame_equal(_comparable(old), _comparable(batched))
+            line += f"  single-row frames {legacy_time:8.2f}s  speedup {legacy_time / batched_time:6.1f}x"
+        print(line)
@@ -0,0 +1,53 @@
+"""
+Compares the chained outer merges that `load_data.patient_to_df` used to join the Disc, Glaucoma
+and Macula visits with the single pass `joins.join_modalities`, for a growing number of patients.
+A fraction of the visits misses one modality, so the outer join has to fill in gaps.
+
+    python -m benchmarks.bench_joins --patients 1000 10000 100000 --visits 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import load_data
+from benchmarks import legacy
+from benchmarks.synthetic import synthetic_records
+from joins import join_modalities
+
+
+def _visit_frames(n_patients, n_visits, missing_prob, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for scan_type in ["Disc3D", "Glaucoma3D", "Macula3D"]:
+        records = synthetic_records(n_patients, n_visits, scan_type, retake_prob=0)
+        df = load_data._handle_same_date_scans(load_data._assemble_frame(records))
+        frames.append(df[rng.random(len(df)) >= missing_prob].reset_index(drop=True))
+    return frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--visits", type=int, default=4)
+    parser.add_argument("--missing_prob", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for n_patients in args.patients:
+        frames = _visit_frames(n_patients, args.visits, args.missing_prob)
+
+        start = time.perf_counter()
+        old = legacy.join_modalities(*frames)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = join_modalities(frames, load_data._SCAN_KEYS)
+        new_time = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(old, new)
+        print(
+            f"patients={n_patients:<7} visits={len(new):<9} "
+            f"merge {legacy_time:7.2f}s  single pass {new_time:7.2f}s  "
+            f"speedup {legacy_time / new_time:5.2f}x"
+        )
@@ -0,0 +1,38 @@
+"""
+Times `load_data.load_xml_data` on a synthetic XML export for a range of worker counts.
+
+    python -m benchmarks.bench_parallel_ingest --n_patients 500 --workers 1 2 4 8
+"""
+
+import argparse
+import tempfile
+import time
+
+import load_data
+from benchmarks.synthetic import write_synthetic_tree
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_patients", type=int, default=500)
+    parser.add_argument("--n_visits", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunksize", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_synthetic_tree(tmp, args.n_patients, args.n_visits)
+        print(f"{len(paths)} files, chunksize {args.chunksize}")
+        reference = None
+        base_time = None
+        for n_workers in args.workers:
+            start = time.perf_counter()
+            df = load_data.load_xml_data(tmp, n_workers, args.chunksize)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference, base_time = df, elapsed
+            else:
+                assert df.equals(reference), "parallel result differs from the first run"
+            print(
+                f"workers={n_workers:<3} {elapsed:8.2f}s "
+                f"{len(paths) / elapsed:9.0f} files/s  speedup {base_time / elapsed:5.2f}x"
+            )
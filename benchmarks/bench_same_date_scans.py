@@ -0,0 +1,93 @@
+"""
+Compares the merge-based same-date deduplication that `load_data._handle_same_date_scans`
+used to do with the current sort/pivot implementation, for a growing number of patients and
+visits per patient.
+
+    python -m benchmarks.bench_same_date_scans --patients 1000 10000 100000 --visits 2 8
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+import load_data
+from benchmarks import legacy
+from benchmarks.synthetic import synthetic_records
+
+
+def _legacy_input(long_df):
+    """
+    Splits a long-format frame into the per-eye frames with R_/L_ prefixed columns that the
+    merge-based implementation expects.
+    """
+    measurements = [
+        col
+        for col in long_df.columns
+        if col
+        not in [
+            *load_data._SCAN_KEYS,
+            "Laterality",
+            "ScanMode",
+            "ExaminationDateTime",
+            "PatientComment",
+            "PatientDisease",
+        ]
+    ]
+    dfs = []
+    for eye in ["R", "L"]:
+        df = long_df[long_df["Laterality"] == eye].reset_index(drop=True)
+        df["Laterality"] = df["Laterality"].astype(object)
+        dfs.append(df.rename(columns={col: f"{eye}_{col}" for col in measurements}))
+    return dfs
+
+
+def _retake_visits(long_df, wide):
+    """
+    Returns a mask of the rows of `wide` whose visit has more than one scan of an eye.
+    """
+    counts = long_df.groupby([*load_data._SCAN_KEYS, "Laterality"], observed=True).size()
+    keys = counts[counts > 1].reset_index()[load_data._SCAN_KEYS].drop_duplicates()
+    keys["retake"] = True
+    return (
+        wide[load_data._SCAN_KEYS]
+        .merge(keys, on=load_data._SCAN_KEYS, how="left")["retake"]
+        .notna()
+        .to_numpy()
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--visits", type=int, nargs="+", default=[2, 8])
+    parser.add_argument("--retake_prob", type=float, default=0.1)
+    args = parser.parse_args()
+
+    for n_visits in args.visits:
+        for n_patients in args.patients:
+            records = synthetic_records(
+                n_patients, n_visits, retake_prob=args.retake_prob
+            )
+            long_df = load_data._assemble_frame(records)
+            old_input = _legacy_input(long_df)
+
+            start = time.perf_counter()
+            old = legacy.handle_same_date_scans(old_input)
+            legacy_time = time.perf_counter() - start
+            start = time.perf_counter()
+            new = load_data._handle_same_date_scans(long_df)
+            new_time = time.perf_counter() - start
+
+            # the retakes of a visit share their ExaminationDateTime, the former unstable sort
+            # keeps an arbitrary one of them, load_data the last one, so only the visits
+            # without retakes have to match exactly
+            old = old.reset_index(drop=True)
+            retakes = _retake_visits(long_df, new)
+            pd.testing.assert_frame_equal(old[load_data._SCAN_KEYS], new[load_data._SCAN_KEYS])
+            pd.testing.assert_frame_equal(old[~retakes], new[~retakes])
+            print(
+                f"patients={n_patients:<7} visits={n_visits:<3} scans={len(long_df):<9} "
+                f"merge {legacy_time:7.2f}s  pivot {new_time:7.2f}s  "
+                f"speedup {legacy_time / new_time:5.2f}x"
+            )
@@ -0,0 +1,41 @@
+"""
+Compares the row-wise `apply` that `scrub_imed` used to remap the iMED patient IDs, a scan of the
+mapping per row, with the single indexed lookup of `scrub_imed.remap_patient_ids`, on a synthetic
+iMED export.
+
+    python -m benchmarks.bench_scrub_imed --patients 10000 --visits 100000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from Anonimization.scrub_imed import remap_patient_ids
+from benchmarks import legacy
+from benchmarks.synthetic import synthetic_imed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=10_000)
+    parser.add_argument("--visits", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for n_visits in args.visits:
+        sheets, merged_id = synthetic_imed(args.patients, n_visits)
+        n_rows = sum(len(df) for df in sheets.values())
+
+        start = time.perf_counter()
+        old = legacy.remap_patient_ids(sheets, merged_id)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = remap_patient_ids(sheets, merged_id)
+        new_time = time.perf_counter() - start
+
+        for sheet_name in sheets:
+            pd.testing.assert_frame_equal(old[sheet_name], new[sheet_name])
+        print(
+            f"patients={args.patients:<7} visits={n_visits:<8} rows={n_rows:<8} "
+            f"apply {legacy_time:7.2f}s  indexed {new_time:7.3f}s  "
+            f"speedup {legacy_time / new_time:7.1f}x"
+        )
@@ -0,0 +1,67 @@
+"""
+Compares the former `split_eyes`, which copied a right and a left sub-frame and concatenated
+them, with the numpy and Arrow backends of `filter_data.split_eyes`, on time and on the memory
+allocated during the reshape.
+
+    python -m benchmarks.bench_split_eyes --visits 10000 100000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import filter_data
+from benchmarks import legacy
+
+
+def _wide_frame(n_visits, seed=0):
+    rng = np.random.default_rng(seed)
+    measurements = {
+        col: rng.uniform(20, 120, n_visits).astype(np.float32)
+        for col in filter_data.COLUMN_INDEX
+    }
+    keys = {
+        "PatientID": pd.Categorical([f"P{i // 4:07d}" for i in range(n_visits)]),
+        "ExaminationDate": pd.Timestamp("2015-01-01")
+        + pd.to_timedelta(np.arange(n_visits) % 4 * 365, unit="D"),
+        "PatientBirthDate": rng.integers(1940, 2000, n_visits).astype(np.int16),
+    }
+    return pd.DataFrame({**keys, **measurements})
+
+
+def _measure(fn, df):
+    # timed without tracing, tracemalloc slows down every allocation
+    start = time.perf_counter()
+    fn(df)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--visits", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for n_visits in args.visits:
+        df = _wide_frame(n_visits)
+        pd.testing.assert_frame_equal(
+            filter_data.merge_eyes(filter_data.split_eyes(df)), df
+        )
+        for name, fn in [
+            ("legacy", legacy.split_eyes),
+            ("numpy", filter_data.split_eyes),
+            ("arrow", lambda df: filter_data.split_eyes(df, backend="arrow")),
+            ("merge_eyes", lambda df: filter_data.merge_eyes(filter_data.split_eyes(df))),
+        ]:
+            seconds, peak = _measure(fn, df)
+            print(
+                f"visits={n_visits:<8} {name:<11} {seconds:7.3f}s  "
+                f"peak allocated {peak / 1024**2:8.1f} MB"
+            )
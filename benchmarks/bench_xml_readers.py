@@ -0,0 +1,68 @@
+"""
+Compares the ElementTree readers (`read_disc_file`, `read_glaucoma_file`, `read_macula_file`)
+with the streaming `read_xml_streaming` on one synthetic file per scan type.
+
+    python -m benchmarks.bench_xml_readers --repeat 2000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import load_data
+from benchmarks.synthetic import disc_tree, glaucoma_tree, macula_tree
+
+
+def _tree_reader(reader):
+    def read(path):
+        pinf_dict, ex_dict, measurement_dict = reader(path)
+        return {**pinf_dict, **ex_dict, **measurement_dict}
+
+    return read
+
+
+_READERS = {
+    "Disc3D": (disc_tree, _tree_reader(load_data.read_disc_file)),
+    "Glaucoma3D": (glaucoma_tree, _tree_reader(load_data.read_glaucoma_file)),
+    "Macula3D": (macula_tree, _tree_reader(load_data.read_macula_file)),
+}
+
+
+def _measure(read, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        read(path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    read(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / repeat * 1e6, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "P0000000"))
+        for scan_mode, (builder, tree_read) in _READERS.items():
+            path = os.path.join(tmp, "P0000000", f"2020-01-01_{scan_mode}_R.xml")
+            root = builder("P0000000", 1970, "F", "R", "2020-01-01", rng)
+            ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+            assert tree_read(path) == load_data.read_xml_streaming(path)
+
+            print(f"{scan_mode} ({os.path.getsize(path)} bytes)")
+            for name, read in [
+                ("ElementTree", tree_read),
+                ("iterparse", load_data.read_xml_streaming),
+            ]:
+                us, peak = _measure(read, path, args.repeat)
+                print(f"  {name:<12} {us:8.1f} us/file  peak {peak / 1024:7.1f} KiB")
@@ -0,0 +1,181 @@
+"""
+Implementations that were replaced in `load_data`, kept so the benchmarks can compare against them.
+"""
+
+import pandas as pd
+
+from xml_schema import get_extractor
+
+
+def handle_same_date_scans(dfs):
+    """
+    Handles scans taken on the same date by separating them into left and right eye scans,
+    dropping retakes, and merging the results.
+    Args:
+        dfs (list of pd.DataFrame): List of DataFrames, each containing scan data with columns
+                                    "ScanMode", "Laterality", "ExaminationDateTime", "ExaminationDate",
+                                    "PatientBirthDate", "PatientID", "PatientSex", "EthnicGroup",
+                                    "PatientComment", and "PatientDisease".
+    Returns:
+        pd.DataFrame: A DataFrame containing the merged scan data for left and right eyes, with
+                      duplicate scans removed and unnecessary columns dropped.
+    Raises:
+        AssertionError: If the scan modes are not consistent across all DataFrames or if the laterality
+                        is not consistent within each DataFrame.
+        ValueError: If there is an issue with merging the left and right DataFrames.
+    """
+    left = []
+    right = []
+    scanmode = []
+    for df in dfs:
+        scanmode.append(df["ScanMode"][0])
+        if all(df["Laterality"] == "R"):
+            right.append(df)
+        else:
+            assert all(df["Laterality"] == "L")
+            left.append(df)
+    assert len(set(scanmode)) <= 1
+    right = pd.concat(right)
+    left = pd.concat(left)
+
+    def drop_retakes(df):
+        df = df.sort_values("ExaminationDateTime", ascending=True)
+        return df.drop_duplicates(
+            [
+                "ExaminationDate",
+                "PatientBirthDate",
+                "PatientID",
+                "PatientSex",
+                "EthnicGroup",
+            ],
+            keep="last",
+        )
+
+    right = drop_retakes(right)
+    left = drop_retakes(left)
+
+    right = right.drop(
+        [
+            "Laterality",
+            "ScanMode",
+            "ExaminationDateTime",
+            "PatientComment",
+            "PatientDisease",
+        ],
+        axis="columns",
+        errors="ignore",
+    )
+    left = left.drop(
+        [
+            "Laterality",
+            "ScanMode",
+            "ExaminationDateTime",
+            "PatientComment",
+            "PatientDisease",
+        ],
+        axis="columns",
+        errors="ignore",
+    )
+
+    try:
+        df = right.merge(
+            left,
+            on=[
+                "ExaminationDate",
+                "PatientBirthDate",
+                "PatientID",
+                "PatientSex",
+                "EthnicGroup",
+            ],
+            how="outer",
+            suffixes=(False, False),
+        )
+    except ValueError as e:
+        print(e)
+        print(right.columns)
+        print(left.columns)
+        raise e
+    return df
+
+
+def single_row_frames(records):
+    """
+    Turns parsed records into one single-row DataFrame per file, as `patient_to_df` used to.
+    """
+    dfs = []
+    for info, layout, row in records:
+        res = xml_to_df_from_record(info, layout, row)
+        dfs.append(res.to_frame().T)
+    return dfs
+
+
+def xml_to_df_from_record(info, layout, row):
+    info = dict(info)
+    info["PatientBirthDate"] = pd.to_datetime(
+        info["PatientBirthDate"], format="%Y-00-00"
+    ).year
+    exam_date = pd.to_datetime(info["ExaminationDateTime"], format="%Y-%m-%d").date()
+    return pd.Series(
+        [*info.values(), *row, exam_date],
+        index=[*info, *get_extractor(*layout).columns, "ExaminationDate"],
+        dtype=object,
+    )
+
+
+def join_modalities(disc, glauc, macula):
+    """
+    Joins the per-modality visit frames with two chained outer merges on the scan keys.
+    """
+    keys = [
+        "ExaminationDate",
+        "PatientBirthDate",
+        "PatientID",
+        "PatientSex",
+        "EthnicGroup",
+    ]
+    df = disc.merge(glauc, on=keys, how="outer", suffixes=(False, False))
+    df = df.merge(macula, on=keys, how="outer", suffixes=(False, False))
+    return df
+
+
+def split_eyes(df):
+    left_c = []
+    right_c = []
+    for c in df.columns:
+        # if not R_ the left or patient data
+        if not c.startswith("R_"):
+            left_c.append(c)
+        if not c.startswith("L_"):
+            right_c.append(c)
+
+    df_r = df[right_c].copy()
+    df_l = df[left_c].copy()
+    df_r["Eye"] = "R"
+    df_l["Eye"] = "L"
+    df_r.rename(columns=lambda x: x[2:] if x.startswith("R_") else x, inplace=True)
+    df_l.rename(columns=lambda x: x[2:] if x.startswith("L_") else x, inplace=True)
+    split_df = pd.concat([df_r, df_l], axis=0).reset_index(drop=True)
+
+    return split_df
+
+
+def remap_patient_ids(imed_df_dict, merged_id):
+    """
+    Remaps the iMED patient IDs of every sheet with a scan of `merged_id` per row, as
+    `scrub_imed` used to.
+    """
+    imed_df_dict = dict(imed_df_dict)
+    for sheet_name, df in imed_df_dict.items():
+        if len(df) == 0:
+            continue
+        df = df[df["Patient ID"].isin(merged_id["Patient ID"])].copy()
+
+        new_ids = df.loc[:, "Patient ID"].apply(
+            lambda x: merged_id.loc[
+                merged_id["Patient ID"] == x, "UnifiedPatientID"
+            ].values[0]
+        )
+        df["Patient ID"] = df["Patient ID"].astype("object")
+        df.loc[:, "Patient ID"] = new_ids
+        imed_df_dict[sheet_name] = df
+    return imed_df_dict
@@ -0,0 +1,261 @@
+import os
+import random
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from xml_schema import get_extractor
+
+_DISC_GROUPS = {
+    "FourSectors": ["Temporal", "Superior", "Nasal", "Inferior"],
+    "TwelveSectors": [
+        "Temporal",
+        "TemporalSuperiorTemporal",
+        "SuperiorSuperiorTemporal",
+        "Superior",
+        "SuperiorSuperiorNasal",
+        "NasalSuperiorNasal",
+        "Nasal",
+        "NasalInferiorNasal",
+        "InferiorInferiorNasal",
+        "Inferior",
+        "InferiorInferiorTemporal",
+        "TemporalInferiorTemporal",
+    ],
+    "RNFLParameters": ["TSNITAverage", "StandardDeviation"],
+    "ONHParameters": [
+        "DiscArea",
+        "RimArea",
+        "CupVolume",
+        "RimVolume",
+        "CDArea",
+        "CDVertical",
+        "CDHorizontal",
+        "RDMinimum",
+        "RimAbsence",
+        "DDLS",
+    ],
+}
+
+_GLAUCOMA_LAYERS = ["GCL_IPL", "NFL_GCL_IPL"]
+_TWO_SECTORS = ["Superior", "Inferior"]
+_EIGHT_SECTORS = [
+    "ParaInferiorNasal",
+    "ParaInferiorTemporal",
+    "ParaSuperiorTemporal",
+    "ParaSuperiorNasal",
+    "PeriInferiorNasal",
+    "PeriInferiorTemporal",
+    "PeriSuperiorTemporal",
+    "PeriSuperiorNasal",
+]
+
+_MACULA_LAYERS = ["ILM_RPE", "ILM_BM"]
+_ETDRS_SECTORS = [
+    "ParaTemporal",
+    "PeriTemporal",
+    "ParaNasal",
+    "PeriNasal",
+    "ParaSuperior",
+    "PeriSuperior",
+    "ParaInferior",
+    "PeriInferior",
+    "Central",
+]
+_FULL_RETINAL = ["Minimum", "Average", "Volume"]
+
+
+def _value(rng):
+    return f"{rng.uniform(20, 120):.2f}"
+
+
+def _add_values(parent, tags, rng):
+    for tag in tags:
+        ET.SubElement(parent, tag).text = _value(rng)
+
+
+def _common(pid, birth_year, sex, laterality, scan_mode, ex_date):
+    root = ET.Element("Data")
+    pinf = ET.SubElement(root, "PatientInformation")
+    ET.SubElement(pinf, "PatientID").text = pid
+    ET.SubElement(pinf, "PatientNameGroup1").text = ""
+    ET.SubElement(pinf, "PatientBirthDate").text = f"{birth_year}-00-00"
+    ET.SubElement(pinf, "PatientSex").text = sex
+    ET.SubElement(pinf, "EthnicGroup").text = "Unknown"
+    ET.SubElement(pinf, "PatientComment").text = None
+    ET.SubElement(pinf, "PatientDisease").text = None
+    ex = ET.SubElement(root, "ExaminationInformation")
+    ET.SubElement(ex, "ScanMode").text = scan_mode
+    ET.SubElement(ex, "Laterality").text = laterality
+    ET.SubElement(ex, "ExaminationDateTime").text = ex_date
+    return root
+
+
+def disc_tree(pid, birth_year, sex, laterality, ex_date, rng):
+    root = _common(pid, birth_year, sex, laterality, "Disc3D", ex_date)
+    measurement = ET.SubElement(root, "DiscMeasurementData")
+    for group, tags in _DISC_GROUPS.items():
+        _add_values(ET.SubElement(measurement, group), tags, rng)
+    return root
+
+
+def glaucoma_tree(pid, birth_year, sex, laterality, ex_date, rng):
+    root = _common(pid, birth_year, sex, laterality, "Glaucoma3D", ex_date)
+    measurement = ET.SubElement(root, "GlaucomaMeasurementData")
+    thickness = ET.SubElement(ET.SubElement(measurement, "TotalSector"), "Thickness")
+    for layer in _GLAUCOMA_LAYERS:
+        _add_values(ET.SubElement(thickness, layer), ["Average"], rng)
+    for group, sectors in [
+        ("TwoSectors", _TWO_SECTORS),
+        ("EightSectors", _EIGHT_SECTORS),
+    ]:
+        node = ET.SubElement(measurement, group)
+        for kind in ["Thickness", "DifferenceSI"]:
+            kind_node = ET.SubElement(node, kind)
+            for layer in _GLAUCOMA_LAYERS:
+                _add_values(ET.SubElement(kind_node, layer), sectors, rng)
+    return root
+
+
+def macula_tree(pid, birth_year, sex, laterality, ex_date, rng):
+    root = _common(pid, birth_year, sex, laterality, "Macula3D", ex_date)
+    measurement = ET.SubElement(root, "MaculaMeasurementData")
+    for group, tags in [
+        ("ETDRSSectors", _ETDRS_SECTORS),
+        ("FullRetinalParameters", _FULL_RETINAL),
+    ]:
+        node = ET.SubElement(measurement, group)
+        for layer in _MACULA_LAYERS:
+            _add_values(ET.SubElement(node, layer), tags, rng)
+    return root
+
+
+_SCAN_TYPES = {
+    "Disc3D": disc_tree,
+    "Glaucoma3D": glaucoma_tree,
+    "Macula3D": macula_tree,
+}
+
+
+def write_synthetic_tree(out_dir, n_patients, n_visits=3, retake_prob=0.1, seed=0):
+    """
+    Writes a directory of synthetic, already scrubbed XML scan files with the same layout
+    as the export read by `load_data.load_xml_data`.
+    Args:
+        out_dir (str): Directory the `<PatientID>/<date>_<ScanMode>_<Laterality>.xml` files are written to.
+        n_patients (int): Number of patients to generate.
+        n_visits (int): Number of visits per patient, every visit has all scan types for both eyes.
+        retake_prob (float): Probability that a scan is retaken on the same day.
+        seed (int): Seed for the random generator.
+    Returns:
+        list: The paths of all written files.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for p in range(n_patients):
+        pid = f"P{p:07d}"
+        birth_year = rng.randint(1940, 2000)
+        sex = rng.choice(["M", "F"])
+        patient_dir = os.path.join(out_dir, pid)
+        os.makedirs(patient_dir, exist_ok=True)
+        for v in range(n_visits):
+            ex_date = f"{2015 + v}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            for scan_mode, builder in _SCAN_TYPES.items():
+                for laterality in ["R", "L"]:
+                    takes = 2 if rng.random() < retake_prob else 1
+                    for take in range(takes):
+                        root = builder(pid, birth_year, sex, laterality, ex_date, rng)
+                        name = f"{ex_date}_{take}_{scan_mode}_{laterality}.xml"
+                        path = os.path.join(patient_dir, name)
+                        ET.ElementTree(root).write(
+                            path, encoding="utf-8", xml_declaration=True
+                        )
+                        paths.append(path)
+    return paths
+
+
+def synthetic_records(n_patients, n_visits=3, scan_type="Glaucoma3D", retake_prob=0.1, seed=0):
+    """
+    Builds parsed records, as returned by `load_data._read_record`, without writing any files.
+    Every visit has a scan of both eyes, retakes share the ExaminationDateTime of the visit.
+    Returns:
+        list of tuple: The records, ordered per patient and visit.
+    """
+    rng = np.random.default_rng(seed)
+    n_columns = len(get_extractor(scan_type, "R").columns)
+    records = []
+    for p in range(n_patients):
+        for v in range(n_visits):
+            ex_date = f"{2000 + v // 12}-{v % 12 + 1:02d}-{p % 28 + 1:02d}"
+            for laterality in ["R", "L"]:
+                takes = 2 if rng.random() < retake_prob else 1
+                for _ in range(takes):
+                    info = {
+                        "PatientID": f"P{p:07d}",
+                        "PatientBirthDate": f"{1940 + p % 60}-00-00",
+                        "PatientSex": "MF"[p % 2],
+                        "EthnicGroup": "Unknown",
+                        "PatientComment": None,
+                        "PatientDisease": None,
+                        "ScanMode": scan_type,
+                        "Laterality": laterality,
+                        "ExaminationDateTime": ex_date,
+                    }
+                    row = rng.uniform(20, 120, size=n_columns)
+                    records.append((info, (scan_type, laterality), row))
+    return records
+
+
+def synthetic_imed(n_patients, n_visit_rows, mapped_prob=0.9, seed=0):
+    """
+    Builds the sheets of a synthetic iMED export and the patient mapping of `scrub_imed`.
+    Args:
+        n_patients (int): Number of patients in the "Identification" sheet.
+        n_visit_rows (int): Number of rows of the "Visits" sheet, spread over the patients.
+        mapped_prob (float): Probability that a patient has a UnifiedPatientID.
+        seed (int): Seed for the random generator.
+    Returns:
+        tuple: A tuple containing:
+            - sheets (dict): Sheet name -> pd.DataFrame, "Identification", "Visits" and
+              "Relapses" (a row per patient).
+            - merged_id (pd.DataFrame): "Patient ID" -> "UnifiedPatientID" of the mapped patients.
+    """
+    rng = np.random.default_rng(seed)
+    pids = np.array([f"I{p:07d}" for p in range(n_patients)], dtype=object)
+    dates = pd.Timestamp("2000-01-01") + pd.to_timedelta(
+        rng.integers(0, 8000, n_patients), unit="D"
+    )
+    identification = pd.DataFrame(
+        {
+            "Patient ID": pids,
+            "Last Name": [f"name{p}" for p in range(n_patients)],
+            "First Name": [f"first{p}" for p in range(n_patients)],
+            "Birth Date": (dates - pd.DateOffset(years=30)).strftime("%d.%m.%Y"),
+            "Gender": rng.choice(["M", "F"], n_patients),
+            "Date of onset": dates.strftime("%d.%m.%Y"),
+        }
+    )
+    edss = rng.integers(0, 20, n_visit_rows) / 2
+    visit_dates = pd.Timestamp("2010-01-01") + pd.to_timedelta(
+        rng.integers(0, 5000, n_visit_rows), unit="D"
+    )
+    visits = pd.DataFrame(
+        {
+            "Patient ID": pids[rng.integers(0, n_patients, n_visit_rows)],
+            "Visit Date": visit_dates.strftime("%d.%m.%Y"),
+            "EDSS": [f"{value:.1f}".replace(".", ",") for value in edss],
+        }
+    )
+    relapses = pd.DataFrame(
+        {"Patient ID": pids, "Relapses": rng.integers(0, 5, n_patients)}
+    )
+    mapped = rng.random(n_patients) < mapped_prob
+    merged_id = pd.DataFrame(
+        {
+            "Patient ID": pids[mapped],
+            "UnifiedPatientID": [f"U{p:07d}" for p in np.flatnonzero(mapped)],
+        }
+    )
+    sheets = {"Identification": identification, "Visits": visits, "Relapses": relapses}
+    return sheets, merged_id
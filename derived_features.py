@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+_EYES = ["R", "L"]
+_RNFL_TWELVE_SECTORS = [
+    "Temporal",
+    "TemporalSuperiorTemporal",
+    "SuperiorSuperiorTemporal",
+    "Superior",
+    "SuperiorSuperiorNasal",
+    "NasalSuperiorNasal",
+    "Nasal",
+    "NasalInferiorNasal",
+    "InferiorInferiorNasal",
+    "Inferior",
+    "InferiorInferiorTemporal",
+    "TemporalInferiorTemporal",
+]
+_ETDRS_INNER = ["ParaTemporal", "ParaNasal", "ParaSuperior", "ParaInferior"]
+_ETDRS_OUTER = ["PeriTemporal", "PeriNasal", "PeriSuperior", "PeriInferior"]
+_GCL_SUPERIOR = [
+    "ParaSuperiorTemporal",
+    "ParaSuperiorNasal",
+    "PeriSuperiorTemporal",
+    "PeriSuperiorNasal",
+]
+_GCL_INFERIOR = [
+    "ParaInferiorNasal",
+    "ParaInferiorTemporal",
+    "PeriInferiorNasal",
+    "PeriInferiorTemporal",
+]
+_INTER_EYE_COLUMNS = [
+    "RNFLParameters_TSNITAverage",
+    "FourSectors_Temporal",
+    "FourSectors_Superior",
+    "FourSectors_Nasal",
+    "FourSectors_Inferior",
+    "Total_Thickness_GCL_IPL",
+    "Total_Thickness_NFL_GCL_IPL",
+    "ETDRSSectors_ILM_RPE_Central",
+    "FullRetinal_ILM_RPE_Average",
+    "FullRetinal_ILM_BM_Average",
+]
+
+# output column -> {"group", "op", "inputs"}, see `register_feature`
+FEATURES = {}
+
+
+def register_feature(name, group, op, *inputs):
+    """
+    Declares a derived feature, it is only computed when requested.
+    Args:
+        name (str): The output column.
+        group (str): Group the feature is requested with, e.g. "RNFL".
+        op (str): "min", "max" or "mean" of the columns in `inputs[0]`, or "asymmetry"
+                  ((a - b) / mean of a and b), "difference" (a - b) or "abs_difference" (|a - b|)
+                  of the means a and b of the columns in `inputs[0]` and `inputs[1]`.
+        inputs (list of str): One or two lists of input columns.
+    """
+    if op not in _OPS:
+        raise ValueError(f"Unknown op {op}, expected one of {list(_OPS)}")
+    if len(inputs) != _OPS[op]:
+        raise ValueError(f"{op} takes {_OPS[op]} lists of input columns")
+    FEATURES[name] = {"group": group, "op": op, "inputs": tuple(map(tuple, inputs))}
+
+
+# op -> number of input column lists
+_OPS = {
+    "min": 1,
+    "max": 1,
+    "mean": 1,
+    "asymmetry": 2,
+    "difference": 2,
+    "abs_difference": 2,
+}
+
+for eye in _EYES:
+    twelve = [f"{eye}_TwelveSectors_{sector}" for sector in _RNFL_TWELVE_SECTORS]
+    register_feature(f"{eye}_RNFLParameters_Minimum", "RNFL", "min", twelve)
+    register_feature(f"{eye}_RNFLParameters_Maximum", "RNFL", "max", twelve)
+    register_feature(f"{eye}_RNFLParameters_Mean", "RNFL", "mean", twelve)
+    register_feature(
+        f"{eye}_FourSectors_Asymmetry",
+        "RNFL",
+        "asymmetry",
+        [f"{eye}_FourSectors_Superior"],
+        [f"{eye}_FourSectors_Inferior"],
+    )
+
+    for layer in ["ILM_RPE", "ILM_BM"]:
+        prefix = f"{eye}_ETDRSSectors_{layer}"
+        inner = [f"{prefix}_{sector}" for sector in _ETDRS_INNER]
+        outer = [f"{prefix}_{sector}" for sector in _ETDRS_OUTER]
+        sectors = [f"{prefix}_Central"] + inner + outer
+        register_feature(f"{prefix}_InnerMean", "MACULA", "mean", inner)
+        register_feature(f"{prefix}_OuterMean", "MACULA", "mean", outer)
+        register_feature(f"{prefix}_Minimum", "MACULA", "min", sectors)
+        register_feature(f"{prefix}_Maximum", "MACULA", "max", sectors)
+        register_feature(
+            f"{prefix}_Asymmetry",
+            "MACULA",
+            "asymmetry",
+            [f"{prefix}_ParaSuperior", f"{prefix}_PeriSuperior"],
+            [f"{prefix}_ParaInferior", f"{prefix}_PeriInferior"],
+        )
+
+    for layer in ["GCL_IPL", "NFL_GCL_IPL"]:
+        register_feature(
+            f"{eye}_TwoSect_Thickness_{layer}_Asymmetry",
+            "GCL_IPL",
+            "asymmetry",
+            [f"{eye}_TwoSect_Thickness_{layer}_Superior"],
+            [f"{eye}_TwoSect_Thickness_{layer}_Inferior"],
+        )
+        register_feature(
+            f"{eye}_EightSect_Thickness_{layer}_Asymmetry",
+            "GCL_IPL",
+            "asymmetry",
+            [f"{eye}_EightSect_Thickness_{layer}_{sector}" for sector in _GCL_SUPERIOR],
+            [f"{eye}_EightSect_Thickness_{layer}_{sector}" for sector in _GCL_INFERIOR],
+        )
+
+for col in _INTER_EYE_COLUMNS:
+    register_feature(
+        f"InterEye_{col}", "INTER_EYE", "abs_difference", [f"R_{col}"], [f"L_{col}"]
+    )
+
+
+def requested_features(names=None, groups=None) -> list[str]:
+    """
+    Resolves a request into feature names, in registration order.
+    Args:
+        names (list of str | None): Features to compute.
+        groups (list of str | str | None): Groups to compute all features of.
+                                           Both None requests every feature.
+    """
+    if names is None and groups is None:
+        return list(FEATURES)
+    if isinstance(groups, str):
+        groups = [groups]
+    requested = set(names or [])
+    unknown = requested.difference(FEATURES)
+    if unknown:
+        raise KeyError(f"Unknown features {sorted(unknown)}")
+    return [
+        name
+        for name, feature in FEATURES.items()
+        if name in requested or (groups is not None and feature["group"] in groups)
+    ]
+
+
+def _nanmean(values, axis):
+    # (features, inputs, rows) -> mean over the inputs that are not missing, without the
+    # all-NaN warnings of np.nanmean
+    present = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(present, values, 0).sum(axis=axis) / present.sum(axis=axis)
+
+
+def compute_features(df: pd.DataFrame, names=None, groups=None) -> pd.DataFrame:
+    """
+    Computes the requested derived features. All input columns are gathered once into a float32
+    (columns, rows) block, and every op is applied to all features that share it and their
+    number of inputs in one batched NumPy call, for both eyes at once.
+    Args:
+        df (pd.DataFrame): The wide frame, with "R_"/"L_" prefixed measurement columns.
+        names, groups: The requested features, see `requested_features`.
+    Returns:
+        pd.DataFrame: The derived features as float32 columns, with the index of `df`.
+    Raises:
+        KeyError: If an input column of a requested feature is not in `df`.
+    """
+    names = requested_features(names, groups)
+    inputs = list(
+        dict.fromkeys(
+            col for name in names for cols in FEATURES[name]["inputs"] for col in cols
+        )
+    )
+    missing = [col for col in inputs if col not in df.columns]
+    if missing:
+        raise KeyError(f"Input columns {missing} not found in the frame")
+
+    position = {col: i for i, col in enumerate(inputs)}
+    values = np.empty((len(inputs), len(df)), dtype=np.float32)
+    for i, col in enumerate(inputs):
+        values[i] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)
+
+    batches = {}
+    for i, name in enumerate(names):
+        feature = FEATURES[name]
+        shape = tuple(len(cols) for cols in feature["inputs"])
+        batches.setdefault((feature["op"], shape), []).append(i)
+
+    out = np.empty((len(names), len(df)), dtype=np.float32)
+    for (op, _), rows in batches.items():
+        # (features, inputs, rows) blocks of the first and second input lists
+        blocks = []
+        for k in range(_OPS[op]):
+            index = [[position[col] for col in FEATURES[names[i]]["inputs"][k]] for i in rows]
+            blocks.append(values[np.array(index)])
+        if op == "min":
+            out[rows] = np.fmin.reduce(blocks[0], axis=1)
+        elif op == "max":
+            out[rows] = np.fmax.reduce(blocks[0], axis=1)
+        elif op == "mean":
+            out[rows] = _nanmean(blocks[0], axis=1)
+        else:
+            a = _nanmean(blocks[0], axis=1)
+            b = _nanmean(blocks[1], axis=1)
+            if op == "asymmetry":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[rows] = (a - b) / ((a + b) / 2)
+            elif op == "difference":
+                out[rows] = a - b
+            else:
+                out[rows] = np.abs(a - b)
+    return pd.DataFrame(out.T, columns=names, index=df.index, copy=False)
+
+
+def add_features(df: pd.DataFrame, names=None, groups=None) -> pd.DataFrame:
+    """
+    Returns `df` with the requested derived features appended, see `compute_features`.
+    """
+    return pd.concat([df, compute_features(df, names, groups)], axis=1)
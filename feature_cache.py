@@ -0,0 +1,261 @@
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import time
+import types
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Hashes the content of a frame: its index, column names, dtypes and values. Numeric columns
+    are hashed on their raw buffers, other columns through `pd.util.hash_pandas_object`.
+    """
+    h = hashlib.sha1()
+    h.update(repr((df.shape, list(df.columns), [str(t) for t in df.dtypes])).encode())
+    h.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    for _, col in df.items():
+        values = col.to_numpy() if isinstance(col.dtype, np.dtype) else None
+        if values is not None and values.dtype.kind in "biufcmM":
+            h.update(np.ascontiguousarray(values).view(np.uint8))
+        else:
+            h.update(pd.util.hash_pandas_object(col, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _hash_param(h, value):
+    # hashes a transform parameter on its content, reprs of frames and large arrays are
+    # truncated and those of most objects only hold their address
+    if isinstance(value, pd.DataFrame):
+        h.update(b"frame" + dataset_fingerprint(value).encode())
+    elif isinstance(value, pd.Series):
+        h.update(b"series" + dataset_fingerprint(value.to_frame()).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(repr(("array", value.dtype.str, value.shape)).encode())
+        if value.dtype.kind in "biufcmM":
+            h.update(np.ascontiguousarray(value).view(np.uint8))
+        else:
+            _hash_param(h, value.tolist())
+    elif isinstance(value, (list, tuple)):
+        h.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _hash_param(h, item)
+    elif isinstance(value, dict):
+        h.update(f"dict{len(value)}".encode())
+        for k, item in sorted(value.items(), key=lambda x: repr(x[0])):
+            _hash_param(h, k)
+            _hash_param(h, item)
+    elif value is None or isinstance(value, (str, bytes, bool, int, float, np.generic)):
+        h.update(repr(value).encode())
+    else:
+        raise TypeError(
+            f"Can not build a cache key from a parameter of type {type(value).__name__}"
+        )
+
+
+def _hash_code(h, code):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):  # nested functions, lambdas and comprehensions
+            _hash_code(h, const)
+        elif isinstance(const, frozenset):  # `x in {...}`, its repr order changes between runs
+            h.update(repr(sorted(map(repr, const))).encode())
+        else:
+            h.update(repr(const).encode())
+
+
+def transform_version(transform) -> str:
+    """
+    Returns the version of a transform for the cache key: its `version` attribute when it has
+    one, otherwise a hash of its bytecode, constants, referenced names and defaults. Editing the
+    transform then invalidates its cached results. Changes to the helpers it calls are not
+    seen, set or bump `version` on transforms whose helpers change.
+    """
+    version = getattr(transform, "version", None)
+    if version is not None:
+        return repr(version)
+    code = getattr(transform, "__code__", None)
+    if code is None:
+        return ""
+    h = hashlib.sha1()
+    _hash_code(h, code)
+    h.update(repr(getattr(transform, "__defaults__", None)).encode())
+    h.update(repr(getattr(transform, "__kwdefaults__", None)).encode())
+    return h.hexdigest()
+
+
+def _bound_params(transform, df, args, params):
+    # the arguments after `df` by parameter name, defaults included
+    try:
+        signature = inspect.signature(transform)
+    except (TypeError, ValueError):  # e.g. builtins without a signature
+        return {"args": args, **params}
+    bound = signature.bind(df, *args, **params)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    arguments.pop(next(iter(signature.parameters)))
+    return arguments
+
+
+class FeatureCache:
+    """
+    Memoizes feature transforms such as `filter_data.add_RNFL_summaries` or `split_eyes`.
+
+    A result is keyed by the fingerprint of the input frame (see `dataset_fingerprint`), the
+    transform, its code version (see `transform_version`) and its parameters, so rerunning the
+    feature stage on an unchanged dataset only costs the hash of the input. Results are kept in memory with LRU eviction and, when
+    `cache_dir` is set, also pickled to disk so they survive a restart of the kernel.
+    """
+
+    def __init__(self, max_items=16, cache_dir=None, max_bytes=None, copy_results=True):
+        """
+        Args:
+            max_items (int): Number of results kept in memory.
+            cache_dir (str | None): Directory for results on disk, None keeps them in memory only.
+            max_bytes (int | None): Size limit of `cache_dir`, None disables eviction on disk.
+            copy_results (bool): Hand out copies of the cached frames. Disable it when the
+                                 results are never modified, a hit then skips the copy.
+        """
+        self.max_items = max_items
+        self.copy_results = copy_results
+        self.cache_dir = None if cache_dir is None else str(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, transform, df, params):
+        """
+        Args:
+            transform (callable): The transform.
+            df (pd.DataFrame): Its input frame.
+            params (dict): Its other arguments by name. Frames, series, arrays, containers
+                           and scalars are hashed on their content.
+        Raises:
+            TypeError: If a parameter is of another type, its repr would not identify it.
+        """
+        name = f"{transform.__module__}.{transform.__qualname__}"
+        version = transform_version(transform)
+        h = hashlib.sha1()
+        _hash_param(h, params)
+        return hashlib.sha1(
+            f"{dataset_fingerprint(df)}|{name}|{version}|{h.hexdigest()}".encode("utf-8")
+        ).hexdigest()
+
+    def __call__(self, transform, df: pd.DataFrame, *args, **params):
+        """
+        Returns `transform(df, *args, **params)`, from the cache when it was computed before.
+        The arguments are bound to the signature of the transform for the key, so passing one
+        by position, by name or leaving it at its default gives the same key. The transform
+        gets a shallow copy of `df`, so transforms that add columns in place, like
+        `add_RNFL_summaries`, leave `df` unchanged on a miss as on a hit.
+        """
+        key = self.key(transform, df, _bound_params(transform, df, args, params))
+        res = self._get(key)
+        if res is None:
+            self.misses += 1
+            res = transform(df.copy(deep=False), *args, **params)
+            self._put(key, res)
+        else:
+            self.hits += 1
+        # callers may modify the result, the cached one has to stay as computed
+        if self.copy_results and isinstance(res, (pd.DataFrame, pd.Series)):
+            return res.copy()
+        return res
+
+    def wrap(self, transform):
+        """
+        Returns `transform` memoized through this cache, e.g.
+        `split_eyes = cache.wrap(filter_data.split_eyes)`.
+        """
+
+        def cached(df, *args, **params):
+            return self(transform, df, *args, **params)
+
+        cached.__name__ = transform.__name__
+        cached.__doc__ = transform.__doc__
+        return cached
+
+    def _get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, key + ".pkl")
+        try:
+            with open(path, "rb") as f:
+                res = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        self._remember(key, res)
+        return res
+
+    def _put(self, key, res):
+        self._remember(key, res)
+        if self.cache_dir is None:
+            return
+        path = os.path.join(self.cache_dir, key + ".pkl")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(res, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _remember(self, key, res):
+        self._memory[key] = res
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        if self.max_bytes is None:
+            return
+        entries = [
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".pkl")
+        ]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Drops all results, in memory and on disk.
+        """
+        self._memory.clear()
+        if self.cache_dir is not None:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._memory),
+        }
+
+    def log_stats(self, level=logging.INFO):
+        stats = self.stats()
+        logger.log(
+            level,
+            f"feature cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['entries']} entries in memory",
+        )
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from filter_data import FeatureView, selected_positions
+
+
+class FeatureGroupSelector(TransformerMixin, BaseEstimator):
+    """
+    scikit-learn transformer that applies the filter_data filters as one column selection, so
+    the feature groups can be tuned inside a `Pipeline` and `GridSearchCV`, e.g.
+
+        pipe = Pipeline([("groups", FeatureGroupSelector()), ("model", RandomForestRegressor())])
+        GridSearchCV(pipe, {"groups__filters": [{"RNFL": "FourSectors"}, {"ONH": None}]})
+
+    The positions of the kept columns are resolved once in `fit`, `transform` only copies the
+    selected columns of every fold.
+    """
+
+    def __init__(self, filters=None):
+        """
+        Args:
+            filters (dict | list of tuple | None): See `filter_data.filter_groups`, None keeps all
+                                                  columns.
+        """
+        self.filters = filters
+
+    @classmethod
+    def from_view(cls, view: FeatureView):
+        """
+        Builds the transformer from the filters recorded on a `FeatureView`.
+        """
+        return cls(filters=view._items())
+
+    def fit(self, X: pd.DataFrame, y=None):
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
+        self.positions_ = selected_positions(X.columns, self.filters or {})
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        if list(X.columns) != list(self.feature_names_in_):
+            raise ValueError("X has other columns than the frame the selector was fitted on")
+        return X.take(self.positions_, axis=1)
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_in_[self.positions_]
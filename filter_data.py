@@ -1,6 +1,9 @@
+from functools import lru_cache
 from typing import Literal
+import numpy as np
 import pandas as pd
 
+from derived_features import compute_features, requested_features
 
 
 _RNFL_COLUMNS = [
@@ -204,6 +207,108 @@ _MACULA_COLUMNS = [
 ]
 
 
+_LAYERS = ["NFL_GCL_IPL", "GCL_IPL", "ILM_RPE", "ILM_BM"]
+
+
+def _parse_column(col: str, modality: str) -> dict:
+    eye, rest = col.split("_", 1)
+    layer = next((layer for layer in _LAYERS if f"_{layer}" in f"_{rest}"), None)
+    if layer is None:
+        scheme, region = rest.split("_", 1)
+    else:
+        scheme, _, region = rest.partition(layer)
+        scheme = scheme.rstrip("_") or None
+        region = region.lstrip("_") or None
+    return {
+        "modality": modality,
+        "eye": eye,
+        "scheme": scheme,
+        "layer": layer,
+        "region": region,
+    }
+
+
+_COLUMN_GROUPS = {
+    "RNFL": _RNFL_COLUMNS,
+    "ONH": _ONH_COLUMNS,
+    "GLAUCOMA": _GLUACOMA_COLUMNS,
+    "MACULA": _MACULA_COLUMNS,
+}
+
+# column name -> modality, eye, sector scheme, layer and region, e.g.
+# "R_TwoSect_Thickness_GCL_IPL_Superior" -> GLAUCOMA, R, TwoSect_Thickness, GCL_IPL, Superior
+COLUMN_INDEX = {
+    col: _parse_column(col, modality)
+    for modality, columns in _COLUMN_GROUPS.items()
+    for col in columns
+}
+
+
+def _as_tuple(value):
+    if value is None or isinstance(value, tuple):
+        return value
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+@lru_cache(maxsize=None)
+def _select_columns(modality, eye, scheme, layer, region) -> tuple[str, ...]:
+    criteria = {
+        "modality": modality,
+        "eye": eye,
+        "scheme": scheme,
+        "layer": layer,
+        "region": region,
+    }
+    return tuple(
+        col
+        for col, info in COLUMN_INDEX.items()
+        if all(
+            values is None or info[field] in values
+            for field, values in criteria.items()
+        )
+    )
+
+
+def select_columns(
+    modality=None, eye=None, scheme=None, layer=None, region=None
+) -> list[str]:
+    """
+    Looks up measurement columns in `COLUMN_INDEX`. Every criterion is a value or a list of
+    values, None matches everything.
+    Example:
+        select_columns("MACULA", eye="R", layer="ILM_BM", region=["Central", "ParaNasal"])
+    Returns:
+        list[str]: The matching columns, in the order of the column lists.
+    """
+    return list(
+        _select_columns(
+            *(_as_tuple(value) for value in (modality, eye, scheme, layer, region))
+        )
+    )
+
+
+def column_positions(df: pd.DataFrame, **criteria) -> np.ndarray:
+    """
+    Integer positions in `df` of the columns matched by `select_columns(**criteria)` that are
+    present in `df`.
+    """
+    columns = _select_columns(
+        *(
+            _as_tuple(criteria.get(field))
+            for field in ("modality", "eye", "scheme", "layer", "region")
+        )
+    )
+    return _positions(tuple(df.columns), columns)
+
+
+@lru_cache(maxsize=4096)
+def _positions(columns: tuple, selected: tuple) -> np.ndarray:
+    lookup = {col: i for i, col in enumerate(columns)}
+    return np.array([lookup[col] for col in selected if col in lookup], dtype=np.intp)
+
+
 def _create_drop_list(columns: list[str], keep: list | str | None) -> list[str]:
     if keep is None:
         return columns
@@ -221,118 +326,449 @@ def _create_drop_list(columns: list[str], keep: list | str | None) -> list[str]:
     return drop_colums
 
 
+@lru_cache(maxsize=None)
+def _cached_drop_list(group: str, keep) -> frozenset:
+    return frozenset(_create_drop_list(_COLUMN_GROUPS[group], keep and list(keep)))
+
+
+@lru_cache(maxsize=4096)
+def _kept_positions(columns: tuple, drop: frozenset) -> np.ndarray:
+    missing = drop.difference(columns)
+    if missing:
+        # same error as DataFrame.drop
+        raise KeyError(f"{sorted(missing)} not found in axis")
+    return np.array(
+        [i for i, col in enumerate(columns) if col not in drop], dtype=np.intp
+    )
+
+
+def _drop_columns(df: pd.DataFrame, drop: frozenset) -> pd.DataFrame:
+    return df.take(_kept_positions(tuple(df.columns), drop), axis=1)
+
+
+def _RNFL_drops(columns, keep):
+    return _cached_drop_list("RNFL", _as_tuple(keep))
+
+
+def _ONH_drops(columns, keep):
+    return _cached_drop_list("ONH", _as_tuple(keep))
+
+
+def _MACULA_drops(columns, keep_sector, keep_layers="both"):
+    return _layer_drops("MACULA", _as_tuple(keep_sector), keep_layers)
+
+
+def _GLAUCOMA_drops(columns, keep_sector, keep_layers="both"):
+    return _layer_drops("GLAUCOMA", _as_tuple(keep_sector), keep_layers)
+
+
+@lru_cache(maxsize=None)
+def _layer_drops(group, keep_sector, keep_layers):
+    drop_colums = set(_cached_drop_list(group, keep_sector))
+    columns = _COLUMN_GROUPS[group]
+    if keep_layers == "both":
+        pass
+    elif group == "MACULA" and keep_layers == "ILM_BM":
+        drop_colums.update(col for col in columns if "ILM_RPE" in col)
+    elif group == "MACULA" and keep_layers == "ILM_RPE":
+        drop_colums.update(col for col in columns if "ILM_BM" in col)
+    elif group == "GLAUCOMA" and keep_layers == "GCL_IPL":
+        drop_colums.update(col for col in columns if "NFL" in col)
+    elif group == "GLAUCOMA" and keep_layers == "NFL_GCL_IPL":
+        drop_colums.update(col for col in columns if "NFL" not in col)
+    return frozenset(drop_colums)
+
+
+@lru_cache(maxsize=4096)
+def _GCL_IPL_drops(columns, keep):
+    sel_columns = [
+        col
+        for col in columns
+        if ("TwoSect" in col) or ("EightSect" in col) or ("TotalSector" in col)
+    ]
+    return frozenset(_create_drop_list(sel_columns, keep and list(_as_tuple(keep))))
+
+
+@lru_cache(maxsize=4096)
+def _glaucoma3d_drops(columns, keep):
+    return frozenset(
+        col
+        for col in columns
+        if (("TotalSector" in col) or ("TwoSectors" in col) or ("EightSectors" in col))
+        and keep not in col
+    )
+
+
 def filter_RNFL_groups(
     df: pd.DataFrame,
     keep: Literal["TSNITAverage", "FourSectors", "TwelveSectors"] | list[str],
 ) -> pd.DataFrame:
-    drop_colums = _create_drop_list(_RNFL_COLUMNS, keep)
-    df = df.drop(drop_colums, axis=1)
-    return df
+    return _drop_columns(df, _RNFL_drops(None, keep))
 
 
 def filter_ONH_groups(df, keep):
-    drop_colums = _create_drop_list(_ONH_COLUMNS, keep)
-    df = df.drop(drop_colums, axis=1)
-    return df
+    return _drop_columns(df, _ONH_drops(None, keep))
 
 
 def filter_MACULA_groups(
     df, keep_sector, keep_layers: Literal["both", "ILM_BM", "ILM_RPE"]
 ):
-    drop_colums = _create_drop_list(_MACULA_COLUMNS, keep_sector)
-    if keep_layers == "both":
-        pass
-    elif keep_layers == "ILM_BM":
-        drop_colums.extend([col for col in _MACULA_COLUMNS if "ILM_RPE" in col])
-    elif keep_layers == "ILM_RPE":
-        drop_colums.extend([col for col in _MACULA_COLUMNS if "ILM_BM" in col])
-    df = df.drop(drop_colums, axis=1)
-    return df
+    return _drop_columns(df, _MACULA_drops(None, keep_sector, keep_layers))
 
 
 def filter_GLAUCOMA_groups(
     df, keep_sector, keep_layers: Literal["both", "GCL_IPL", "NFL_GCL_IPL"] = "both"
 ):
-    drop_colums = _create_drop_list(_GLUACOMA_COLUMNS, keep_sector)
-    if keep_layers == "both":
-        pass
-    elif keep_layers == "GCL_IPL":
-        drop_colums.extend([col for col in _GLUACOMA_COLUMNS if "NFL" in col])
-    elif keep_layers == "NFL_GCL_IPL":
-        drop_colums.extend([col for col in _GLUACOMA_COLUMNS if "NFL" not in col])
-    df = df.drop(drop_colums, axis=1)
-    return df
+    return _drop_columns(df, _GLAUCOMA_drops(None, keep_sector, keep_layers))
 
 
 def filter_GCL_IPL_groups(
     df: pd.DataFrame, keep: Literal["TwoSect", "EightSect", "TotalSector"]
 ) -> pd.DataFrame:
-    sel_columns = [
-        col
-        for col in df.columns
-        if ("TwoSect" in col) or ("EightSect" in col) or ("TotalSector" in col)
-    ]
-    drop_colums = _create_drop_list(sel_columns, keep)
-    df = df.drop(drop_colums, axis=1)
-    return df
+    return _drop_columns(df, _GCL_IPL_drops(tuple(df.columns), _as_tuple(keep)))
 
 
 def filter_glaucoma3d(
     df: pd.DataFrame, keep: Literal["TotalSector", "TwoSectors", "EightSectors"]
 ) -> pd.DataFrame:
-    columns = [
-        col
-        for col in df.columns
-        if ("TotalSector" in col) or ("TwoSectors" in col) or ("EightSectors" in col)
-    ]
-    drop_colums = [col for col in columns if keep not in col]
-    df = df.drop(drop_colums, axis=1)
+    return _drop_columns(df, _glaucoma3d_drops(tuple(df.columns), keep))
+
+
+_FILTERS = {
+    "RNFL": _RNFL_drops,
+    "ONH": _ONH_drops,
+    "MACULA": _MACULA_drops,
+    "GLAUCOMA": _GLAUCOMA_drops,
+    "GCL_IPL": lambda columns, keep: _GCL_IPL_drops(columns, _as_tuple(keep)),
+    "glaucoma3d": _glaucoma3d_drops,
+}
+
+
+# filters that also take the layers to keep, given as {"sectors": ..., "layers": ...}
+_LAYER_FILTERS = ("MACULA", "GLAUCOMA")
+
+
+def _filter_items(filters):
+    items = filters.items() if isinstance(filters, dict) else filters
+    for name, args in items:
+        if name not in _FILTERS:
+            raise ValueError(f"Unknown filter {name}, expected one of {list(_FILTERS)}")
+        if name in _LAYER_FILTERS and isinstance(args, dict):
+            unknown = set(args).difference(("sectors", "layers"))
+            if unknown or "sectors" not in args:
+                raise ValueError(
+                    f"{name} expects {{'sectors': ..., 'layers': ...}}, got {sorted(args)}"
+                )
+            args = (args["sectors"], args.get("layers", "both"))
+        else:
+            args = (args,)
+        yield name, args
+
+
+def selected_positions(columns, filters) -> np.ndarray:
+    """
+    Resolves several filters into the positions of the columns they keep.
+    Args:
+        columns (list of str): The columns of the frame to filter.
+        filters (dict | list of tuple): See `filter_groups`, or (name, arguments) pairs.
+    Returns:
+        np.ndarray: The positions of the kept columns, in their original order.
+    Raises:
+        KeyError: If a filter drops a column that is not in `columns`.
+    """
+    columns = tuple(columns)
+    drop = frozenset()
+    for name, args in _filter_items(filters):
+        drop |= _FILTERS[name](columns, *args)
+    return _kept_positions(columns, drop)
+
+
+def filter_groups(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """
+    Applies several of the filters above with a single positional selection, instead of one
+    copy of the frame per filter. Gives the same columns as applying the filters one after
+    the other.
+    Args:
+        df (pd.DataFrame): The frame to filter.
+        filters (dict): Filter name ("RNFL", "ONH", "MACULA", "GLAUCOMA", "GCL_IPL" or
+                        "glaucoma3d") -> what that filter keeps, a tuple or list for several
+                        values. MACULA and GLAUCOMA take their sectors, or a dict to also
+                        select the layers, e.g. {"RNFL": "FourSectors",
+                        "MACULA": ("Central", "ParaNasal"),
+                        "GLAUCOMA": {"sectors": "Superior", "layers": "GCL_IPL"}}.
+    Returns:
+        pd.DataFrame: The filtered frame.
+    """
+    return df.take(selected_positions(df.columns, filters), axis=1)
+
+
+class FeatureView:
+    """
+    Lazy feature selection over a frame. Every filter method returns a new view that records
+    the filter, nothing is computed until `columns` or `to_frame` is used, and then all
+    recorded filters are merged into a single column selection.
+    Example:
+        view = FeatureView(df).RNFL("FourSectors").MACULA("Central", "ILM_BM")
+        X = view.to_frame()
+    """
+
+    def __init__(self, df: pd.DataFrame, filters=()):
+        self.df = df
+        self.filters = tuple(filters)
+
+    def _add(self, name, *args):
+        return FeatureView(self.df, self.filters + ((name, args),))
+
+    def RNFL(self, keep):
+        return self._add("RNFL", keep)
+
+    def ONH(self, keep):
+        return self._add("ONH", keep)
+
+    def MACULA(self, keep_sector, keep_layers="both"):
+        return self._add("MACULA", keep_sector, keep_layers)
+
+    def GLAUCOMA(self, keep_sector, keep_layers="both"):
+        return self._add("GLAUCOMA", keep_sector, keep_layers)
+
+    def GCL_IPL(self, keep):
+        return self._add("GCL_IPL", keep)
+
+    def glaucoma3d(self, keep):
+        return self._add("glaucoma3d", keep)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return selected_positions(self.df.columns, self._items())
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.df.columns[self.positions])
+
+    def _items(self):
+        # in the form of `filter_groups`, see `_filter_items`
+        return [
+            (
+                name,
+                {"sectors": args[0], "layers": args[1]}
+                if name in _LAYER_FILTERS
+                else args[0],
+            )
+            for name, args in self.filters
+        ]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Materializes the view, copying only the selected columns.
+        """
+        return self.df.take(self.positions, axis=1)
+
+    def __repr__(self):
+        steps = "".join(
+            f".{name}({', '.join(map(repr, args))})" for name, args in self.filters
+        )
+        return f"FeatureView({self.df.shape[1]} columns){steps}"
+
+
+def _add_derived(df, names):
+    derived = compute_features(df, names)
+    for col in derived.columns:
+        df[col] = derived[col]
     return df
 
 
 def add_RNFL_summaries(df):
-    for side in ["R", "L"]:
-        tmp = df[
-            [
-                f"{side}_TwelveSectors_Temporal",
-                f"{side}_TwelveSectors_TemporalSuperiorTemporal",
-                f"{side}_TwelveSectors_SuperiorSuperiorTemporal",
-                f"{side}_TwelveSectors_Superior",
-                f"{side}_TwelveSectors_SuperiorSuperiorNasal",
-                f"{side}_TwelveSectors_NasalSuperiorNasal",
-                f"{side}_TwelveSectors_Nasal",
-                f"{side}_TwelveSectors_NasalInferiorNasal",
-                f"{side}_TwelveSectors_InferiorInferiorNasal",
-                f"{side}_TwelveSectors_Inferior",
-                f"{side}_TwelveSectors_InferiorInferiorTemporal",
-                f"{side}_TwelveSectors_TemporalInferiorTemporal",
-            ]
+    """
+    Adds the minimum, maximum and mean of the twelve RNFL sectors of both eyes to `df`.
+    """
+    return _add_derived(
+        df,
+        [
+            f"{side}_RNFLParameters_{summary}"
+            for side in ["R", "L"]
+            for summary in ["Minimum", "Maximum", "Mean"]
+        ],
+    )
+
+
+def add_MACULA_summaries(df):
+    """
+    Adds the ETDRS sector summaries of both eyes and layers to `df`, see the "MACULA" group of
+    `derived_features`.
+    """
+    return _add_derived(df, requested_features(groups="MACULA"))
+
+
+@lru_cache(maxsize=256)
+def _eye_layout(columns: tuple) -> tuple:
+    """
+    The long-format columns of `split_eyes` as (name, position for the right eye rows,
+    position for the left eye rows), a position is None when the eye has no such column.
+    """
+    positions = {col: i for i, col in enumerate(columns)}
+    layout = []
+    for i, col in enumerate(columns):
+        if col.startswith("L_"):
+            continue
+        if col.startswith("R_"):
+            layout.append((col[2:], i, positions.get("L_" + col[2:])))
+        else:
+            layout.append((col, i, i))
+    for i, col in enumerate(columns):
+        if col.startswith("L_") and "R_" + col[2:] not in positions:
+            layout.append((col[2:], None, i))
+    return tuple(layout)
+
+
+def _stack_eyes(right, left, n):
+    if right is None or left is None:
+        series = [
+            pd.Series(side, copy=False) if side is not None else pd.Series(np.nan, index=range(n))
+            for side in (right, left)
         ]
-        df[f"{side}_RNFLParameters_Minimum"] = tmp.min(axis=1)
-        df[f"{side}_RNFLParameters_Maximum"] = tmp.max(axis=1)
-        df[f"{side}_RNFLParameters_Maximum"] = tmp.mean(axis=1)
-    return df
+        return pd.concat(series, ignore_index=True)
+    if isinstance(right.dtype, pd.CategoricalDtype) or isinstance(
+        left.dtype, pd.CategoricalDtype
+    ):
+        return pd.concat([right, left], ignore_index=True)
+    return np.concatenate([right.to_numpy(), left.to_numpy()])
+
+
+def split_eyes(df, backend: Literal["numpy", "arrow"] = "numpy"):
+    """
+    Reshapes the wide frame, with one row per visit and "R_"/"L_" prefixed eye columns, into
+    one row per eye: first all right eyes, then all left eyes, with the prefix stripped and an
+    "Eye" column. `merge_eyes` reverses it.
+    Args:
+        df (pd.DataFrame): The wide frame.
+        backend (str): "numpy" copies the eye columns into one block per dtype, "arrow" backs
+                       every column by the original right and left arrays as two Arrow chunks,
+                       so the numeric columns are not copied at all.
+    Returns:
+        pd.DataFrame: The long frame, with the wide column layout in `attrs`. With the "numpy"
+                      backend the columns, their order and dtypes are those of the former
+                      concatenation of the right and left sub-frames: the columns without
+                      "L_" prefix, then the object column "Eye", then the columns that only
+                      the left eye has. With the "arrow" backend every column except "Eye"
+                      has an Arrow dtype instead.
+    """
+    layout = _eye_layout(tuple(df.columns))
+    n = len(df)
+    eye = np.repeat(np.array(["R", "L"], dtype=object), n)
+    # the columns that only the left eye has come after "Eye", see `_eye_layout`
+    n_before_eye = sum(right is not None for _, right, _ in layout)
+
+    columns = {}
+    if backend == "arrow":
+        import pyarrow as pa
 
-def add_MACULA_summaries():
-    pass
-
-def split_eyes(df):
-    left_c=[]
-    right_c=[]
-    for c in df.columns:
-        # if not R_ the left or patient data
-        if not c.startswith('R_'):
-            left_c.append(c)
-        if not c.startswith('L_'):
-            right_c.append(c)
-
-    df_r = df[right_c].copy()
-    df_l= df[left_c].copy()
-    df_r['Eye']='R'
-    df_l['Eye']='L'
-    df_r.rename(columns=lambda x: x[2:] if x.startswith('R_') else x,inplace=True)
-    df_l.rename(columns=lambda x: x[2:] if x.startswith('L_') else x,inplace=True)
-    split_df=pd.concat([df_r,df_l],axis=0).reset_index(drop=True)
+        for name, right, left in layout:
+            chunks = []
+            for pos in (right, left):
+                if pos is None:
+                    chunks.append(pa.nulls(n))
+                else:
+                    chunks.append(pa.array(df.iloc[:, pos], from_pandas=True))
+            if chunks[0].type != chunks[1].type:
+                chunks = [
+                    chunk.cast(chunks[1 - i].type) if chunk.null_count == n else chunk
+                    for i, chunk in enumerate(chunks)
+                ]
+            columns[name] = pd.arrays.ArrowExtensionArray(pa.chunked_array(chunks))
+    else:
+        # the numeric eye columns of one dtype are written into a single preallocated block
+        blocks = {}
+        for name, right, left in layout:
+            if right is None or left is None or right == left:
+                continue
+            dtypes = {df.dtypes.iloc[right], df.dtypes.iloc[left]}
+            if len(dtypes) == 1 and isinstance(next(iter(dtypes)), np.dtype):
+                blocks.setdefault(next(iter(dtypes)), []).append((name, right, left))
+        filled = {}
+        for dtype, block_columns in blocks.items():
+            # (columns, rows) so that every column is contiguous, as pandas stores it
+            values = np.empty((len(block_columns), 2 * n), dtype=dtype)
+            for j, (name, right, left) in enumerate(block_columns):
+                values[j, :n] = df.iloc[:, right]
+                values[j, n:] = df.iloc[:, left]
+                filled[name] = values[j]
+        for name, right, left in layout:
+            if name in filled:
+                columns[name] = filled[name]
+            else:
+                columns[name] = _stack_eyes(
+                    None if right is None else df.iloc[:, right],
+                    None if left is None else df.iloc[:, left],
+                    n,
+                )
+    names = list(columns)
+    columns = {
+        **{name: columns[name] for name in names[:n_before_eye]},
+        "Eye": eye,
+        **{name: columns[name] for name in names[n_before_eye:]},
+    }
+    split_df = pd.DataFrame(columns, copy=False)
 
+    split_df.attrs["wide_columns"] = list(df.columns)
+    split_df.attrs["eye_columns"] = [
+        name for name, right, left in layout if right != left
+    ]
     return split_df
 
+
+def merge_eyes(df, eye_column="Eye"):
+    """
+    Reverses `split_eyes`: pivots the rows of both eyes of a visit back into one row with
+    "R_"/"L_" prefixed eye columns. The rows are matched on all other columns.
+    Args:
+        df (pd.DataFrame): The long frame, for instance returned by `split_eyes` and filtered.
+        eye_column (str): The column holding "R" or "L".
+    Returns:
+        pd.DataFrame: One row per visit, in order of first appearance. The columns are in the
+                      original wide layout when `df.attrs` still carries it.
+    Raises:
+        ValueError: If a visit has more than one row for an eye.
+    """
+    eye_columns = df.attrs.get("eye_columns")
+    if eye_columns is None:
+        eye_columns = [
+            col
+            for col in df.columns
+            if f"R_{col}" in COLUMN_INDEX or f"L_{col}" in COLUMN_INDEX
+        ]
+    eye_columns = [col for col in eye_columns if col in df.columns]
+    shared = [col for col in df.columns if col not in eye_columns and col != eye_column]
+
+    visit = df.groupby(shared, sort=False, dropna=False, observed=True).ngroup()
+    visit = visit.to_numpy()
+    n_visits = visit.max() + 1 if len(visit) else 0
+    eye = np.asarray(df[eye_column], dtype=object)
+    if pd.Series(visit * 2 + (eye == "L")).duplicated().any():
+        raise ValueError("A visit has more than one row for the same eye")
+
+    first = np.full(n_visits, -1, dtype=np.int64)
+    first[visit[::-1]] = np.arange(len(visit))[::-1]
+    wide = {}
+    for col in shared:
+        wide[col] = df[col].take(first).reset_index(drop=True)
+    for side in ["R", "L"]:
+        rows = np.flatnonzero(eye == side)
+        positions = np.full(n_visits, -1, dtype=np.int64)
+        positions[visit[rows]] = rows
+        present = positions >= 0
+        for col in eye_columns:
+            dtype = df[col].dtype
+            if dtype.kind == "f":
+                # also reads Arrow-backed columns of `split_eyes(backend="arrow")`
+                dtype = getattr(dtype, "numpy_dtype", dtype)
+                values = df[col].to_numpy(dtype=dtype, na_value=np.nan)
+                out = np.full(n_visits, np.nan, dtype=dtype)
+            else:
+                values = df[col].to_numpy()
+                out = np.full(n_visits, None, dtype=object)
+            out[present] = values[positions[present]]
+            wide[f"{side}_{col}"] = out
+    wide_columns = df.attrs.get("wide_columns")
+    if wide_columns is not None and set(wide_columns) == set(wide):
+        wide = {col: wide[col] for col in wide_columns}
+    return pd.DataFrame(wide, copy=False)
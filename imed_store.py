@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# calamine reads the workbook much faster than openpyxl, which is used when python-calamine
+# is not installed
+try:
+    import python_calamine  # noqa: F401
+
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
+logger = logging.getLogger(__name__)
+
+# sheet -> column -> conversion applied before caching, only these columns are read
+IMED_COLUMNS = {
+    "Identification": {"Patient ID": None, "Date of onset": "date"},
+    "Visits": {"Patient ID": None, "Visit Date": "date", "EDSS": "edss"},
+}
+
+_INDEX_FILE = "imed_index.json"
+
+
+def parse_edss(edss):
+    """
+    Parses EDSS scores written with a decimal comma, e.g. "3,5", in one vectorized pass.
+    """
+    edss = edss.astype("string").str.replace(",", ".", regex=False)
+    return pd.to_numeric(edss).astype(float)
+
+
+def _convert(df, conversions):
+    for col, conversion in conversions.items():
+        if conversion == "date":
+            df[col] = pd.to_datetime(df[col], format="%d.%m.%Y")
+        elif conversion == "edss":
+            df[col] = parse_edss(df[col])
+    return df
+
+
+def read_imed_workbook(imed_path, columns=IMED_COLUMNS) -> dict:
+    """
+    Reads only the given sheets and columns of the iMED workbook and converts them.
+    Args:
+        imed_path (str): Path to the iMED workbook.
+        columns (dict): Sheet -> column -> conversion ("date", "edss" or None).
+    Returns:
+        dict: Sheet -> pd.DataFrame with the columns in the given order.
+    """
+    wanted = {col for sheet_columns in columns.values() for col in sheet_columns}
+    sheets = pd.read_excel(
+        Path(imed_path),
+        sheet_name=list(columns),
+        usecols=lambda col: col in wanted,
+        engine=_EXCEL_ENGINE,
+    )
+    return {
+        sheet: _convert(sheets[sheet][list(sheet_columns)].copy(), sheet_columns)
+        for sheet, sheet_columns in columns.items()
+    }
+
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024**2), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IMEDStore:
+    """
+    Columnar cache of the iMED workbook. The converted sheets are stored as Parquet files named
+    after the sha1 of the workbook and of the columns and conversions read from the sheet, so an
+    unchanged (or copied) workbook is never read through Excel again, and a different column
+    selection is never served from the entry of another one. The sha1 of every workbook is remembered with its size and mtime, a workbook
+    is only hashed again when one of those changes.
+    """
+
+    def __init__(self, cache_dir, columns=IMED_COLUMNS):
+        """
+        Args:
+            cache_dir (str): Directory for the Parquet files, created if missing.
+            columns (dict): Sheets and columns to read, see `read_imed_workbook`.
+        """
+        self.cache_dir = str(cache_dir)
+        self.columns = columns
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index_path = os.path.join(self.cache_dir, _INDEX_FILE)
+        try:
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def workbook_hash(self, imed_path):
+        """
+        Returns the sha1 of the workbook, from the index when its size and mtime are unchanged.
+        """
+        path = os.path.abspath(imed_path)
+        stat = os.stat(path)
+        entry = self._index.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha1"]
+        sha1 = _file_sha1(path)
+        self._index[path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": sha1,
+        }
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+        return sha1
+
+    def _sheet_path(self, sha1, sheet):
+        columns = json.dumps(list(self.columns[sheet].items()))
+        columns_sha1 = hashlib.sha1(columns.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{sha1}_{columns_sha1}_{sheet}.parquet")
+
+    def read(self, imed_path) -> dict:
+        """
+        Returns the converted sheets of the workbook, read from the cache when possible.
+        """
+        sha1 = self.workbook_hash(imed_path)
+        paths = {sheet: self._sheet_path(sha1, sheet) for sheet in self.columns}
+        if all(os.path.exists(path) for path in paths.values()):
+            sheets = {}
+            for sheet, path in paths.items():
+                table = pq.read_table(path, columns=list(self.columns[sheet]))
+                sheets[sheet] = table.to_pandas()
+            return sheets
+
+        logger.info(f"imed store: converting {imed_path}")
+        sheets = read_imed_workbook(imed_path, self.columns)
+        for sheet, df in sheets.items():
+            tmp_path = paths[sheet] + ".tmp"
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+            os.replace(tmp_path, paths[sheet])
+        return sheets
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+_NAT = np.datetime64("NaT", "ns").view("int64")
+_NS_PER_DAY = 86_400 * 10**9
+
+
+def encode_keys(frames, keys):
+    """
+    Encodes the composite key of several frames into one integer code per row.
+    Codes are shared between the frames and numbered in the sorted order of the keys.
+    Args:
+        frames (list of pd.DataFrame): Frames that all contain the `keys` columns.
+        keys (list of str): The key columns.
+    Returns:
+        tuple: A tuple containing:
+            - codes (list of np.ndarray): The codes of every frame.
+            - unique_keys (pd.DataFrame): The key values of every code, one row per code.
+    """
+    all_keys = pd.concat([df[keys] for df in frames], ignore_index=True)
+    all_codes = all_keys.groupby(keys, sort=True, dropna=False).ngroup().to_numpy()
+    n_codes = all_codes.max() + 1 if len(all_codes) else 0
+    # any row of a code carries its key values
+    rows = np.empty(n_codes, dtype=np.int64)
+    rows[all_codes] = np.arange(len(all_codes))
+    unique_keys = all_keys.take(rows).reset_index(drop=True)
+
+    codes = []
+    offset = 0
+    for df in frames:
+        codes.append(all_codes[offset : offset + len(df)])
+        offset += len(df)
+    return codes, unique_keys
+
+
+def join_modalities(frames, keys):
+    """
+    Outer joins the per-modality visit frames on their composite key in a single pass.
+    Gives the same result as chaining `pd.merge(how="outer")` over the frames, but every frame
+    is only copied once into the result.
+    Args:
+        frames (list of pd.DataFrame): Frames with at most one row per key.
+        keys (list of str): The key columns.
+    Returns:
+        pd.DataFrame: One row per key, sorted on the keys. The columns of the first frame keep
+                      their order, the non-key columns of the other frames follow.
+    """
+    codes, unique_keys = encode_keys(frames, keys)
+    positions = np.arange(len(unique_keys))
+
+    columns = {}
+    for i, (df, frame_codes) in enumerate(zip(frames, codes)):
+        if np.bincount(frame_codes, minlength=len(positions)).max(initial=0) > 1:
+            raise ValueError(f"Frame {i} has duplicate keys")
+        values = df.drop(columns=keys).set_axis(frame_codes).reindex(positions)
+        for col in df.columns:
+            if col in keys:
+                if i == 0:
+                    columns[col] = unique_keys[col]
+            else:
+                columns[col] = values[col].to_numpy()
+    return pd.DataFrame(columns)
+
+
+VISIT_DIRECTIONS = ["nearest", "backward", "forward"]
+
+
+def _match_visits_asof(matched, visit_keys, tolerance, direction):
+    # merge_asof needs both sides sorted on the date, `by` matches within a patient
+    left = matched[matched["date"] != _NAT].sort_values("date", kind="stable")
+    right = visit_keys[visit_keys["date"] != _NAT].sort_values("date", kind="stable")
+    right = right.rename(columns={"date": "visit_date"})
+    matched = pd.merge_asof(
+        left,
+        right,
+        left_on="date",
+        right_on="visit_date",
+        by="pid",
+        tolerance=None if tolerance is None else pd.Timedelta(tolerance).value,
+        direction=direction,
+    )
+    matched = matched.dropna(subset=["visit_row"]).sort_values("xml_row", kind="stable")
+    # unmatched exams made the visit columns float
+    matched = matched.astype({"visit_row": np.int64, "visit_date": np.int64})
+    return matched
+
+
+def join_imed(xml_df, imed_df, visit_df, tolerance=None, direction=None):
+    """
+    Inner joins the xml data to the iMED identification (on patient) and visits (on patient
+    and date). Both joins are done on integer codes of the keys and only move row numbers,
+    the wide xml frame is copied once at the end.
+
+    By default an exam is only joined to a visit on the same date. With a `direction` every exam
+    is joined to a visit of the same patient within `tolerance` of the exam instead, through a
+    `pd.merge_asof` on the sorted dates grouped by patient.
+    Args:
+        xml_df (pd.DataFrame): The xml data, with "PatientID" and "ExaminationDate".
+        imed_df (pd.DataFrame): The identification sheet, with "Patient ID".
+        visit_df (pd.DataFrame): The visits sheet, with "Patient ID" and "Visit Date".
+        tolerance (pd.Timedelta | str | None): Largest distance between exam and visit, e.g.
+                                               "30D". None matches any distance.
+        direction (str | None): None for an exact date match, or "nearest", "backward" (the last
+                                visit on or before the exam) or "forward" (the first visit on
+                                or after the exam).
+    Returns:
+        tuple: A tuple containing:
+            - df (pd.DataFrame): The xml columns followed by the other columns of `imed_df`
+              (apart from "Birth Date") and of `visit_df`. An as-of join also keeps the
+              "Visit Date" and adds "visit_distance_days", the exam date minus the visit date.
+            - rows (list of int): The number of rows after the identification and visit join.
+    """
+    if direction is not None and direction not in VISIT_DIRECTIONS:
+        raise ValueError(f"Unknown direction {direction}, expected one of {VISIT_DIRECTIONS}")
+    if direction is None and tolerance is not None:
+        raise ValueError("A tolerance needs a direction")
+    pids, _ = pd.factorize(
+        pd.concat(
+            [xml_df["PatientID"], imed_df["Patient ID"], visit_df["Patient ID"]],
+            ignore_index=True,
+        )
+    )
+    n_xml = len(xml_df)
+    n_imed = len(imed_df)
+    xml_keys = pd.DataFrame(
+        {
+            "pid": pids[:n_xml],
+            "date": xml_df["ExaminationDate"].to_numpy().astype("datetime64[ns]").view("int64"),
+            "xml_row": np.arange(n_xml),
+        }
+    )
+    imed_keys = pd.DataFrame(
+        {"pid": pids[n_xml : n_xml + n_imed], "imed_row": np.arange(n_imed)}
+    )
+    visit_keys = pd.DataFrame(
+        {
+            "pid": pids[n_xml + n_imed :],
+            "date": visit_df["Visit Date"].to_numpy().astype("datetime64[ns]").view("int64"),
+            "visit_row": np.arange(len(visit_df)),
+        }
+    )
+    matched = xml_keys.merge(imed_keys, on="pid", how="inner")
+    rows = [len(matched)]
+    if direction is None:
+        matched = matched.merge(visit_keys, on=["pid", "date"], how="inner")
+    else:
+        matched = _match_visits_asof(matched, visit_keys, tolerance, direction)
+    rows.append(len(matched))
+
+    df = xml_df.take(matched["xml_row"]).reset_index(drop=True)
+    for col in imed_df.columns.drop(["Patient ID", "Birth Date"], errors="ignore"):
+        df[col] = imed_df[col].to_numpy()[matched["imed_row"]]
+    visit_columns = visit_df.columns.drop("Patient ID")
+    if direction is None:
+        visit_columns = visit_columns.drop("Visit Date")
+    for col in visit_columns:
+        df[col] = visit_df[col].to_numpy()[matched["visit_row"]]
+    if direction is not None:
+        distance = matched["date"].to_numpy() - matched["visit_date"].to_numpy()
+        df["visit_distance_days"] = distance // _NS_PER_DAY
+    return df, rows
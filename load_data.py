@@ -1,9 +1,44 @@
+import logging
 import os
+import tempfile
+import time
 import pandas as pd
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 import numpy as np
 
+import snapshot
+from imed_store import read_imed_workbook
+from joins import join_imed, join_modalities
+from xml_schema import SCHEMAS, get_extractor
+
+logger = logging.getLogger(__name__)
+
+# peak memory of parsing and joining a batch, per byte of xml on disk, measured on
+# synthetic exports (about 1.5) with some headroom
+_MEMORY_PER_XML_BYTE = 2.0
+
+
+@contextmanager
+def _stage(report, name, rows_in):
+    """
+    Times a loading stage. The body sets `stage["rows_out"]`, the finished stage is logged and
+    appended to `report` when it is a list.
+    """
+    stage = {"stage": name, "rows_in": rows_in, "rows_out": None}
+    start = time.perf_counter()
+    yield stage
+    stage["seconds"] = time.perf_counter() - start
+    logger.info(
+        f"{name}: {stage['rows_in']} -> {stage['rows_out']} rows "
+        f"in {stage['seconds']:.3f} s"
+    )
+    if report is not None:
+        report.append(stage)
+
 
 def _parse_common(path):
     """
@@ -47,6 +82,13 @@ def _parse_common(path):
     return laterality, root, pinf_dict, ex_dict
 
 
+def _read_measurements(path, scan_type):
+    laterality, root, pinf_dict, ex_dict = _parse_common(path)
+    extractor = get_extractor(scan_type, laterality)
+    row = extractor.extract(root.find(extractor.section), path=path)
+    return pinf_dict, ex_dict, dict(zip(extractor.columns, row))
+
+
 def read_disc_file(path):
     """
     Reads and parses a "disc" XML file to extract optic disc measurement data.
@@ -57,18 +99,9 @@ def read_disc_file(path):
             - pinf_dict (dict): Patient information dictionary.
             - ex_dict (dict): Examination information dictionary.
             - disc_dict (dict): Disc measurement data dictionary, with keys formatted as
-              "{laterality}_{top_tag}_{element_tag}" and values as the corresponding text.
+              "{laterality}_{top_tag}_{element_tag}" and values as floats.
     """
-    laterality, root, pinf_dict, ex_dict = _parse_common(path)
-
-    disc_measure = root.find("DiscMeasurementData")
-    disc_dict = {
-        laterality + "_" + top.tag + "_" + element.tag: element.text
-        for top in disc_measure
-        for element in top
-    }
-
-    return pinf_dict, ex_dict, disc_dict
+    return _read_measurements(path, "Disc3D")
 
 
 def read_glaucoma_file(path):
@@ -82,51 +115,7 @@ def read_glaucoma_file(path):
             - ex_dict (dict): Examination information dictionary.
             - measurement_dict (dict): Dictionary containing parsed measurement data with keys indicating the laterality, sector, and measurement type.
     """
-    laterality, root, pinf_dict, ex_dict = _parse_common(path)
-    measurement = root.find("GlaucomaMeasurementData")
-    tot = measurement.find("TotalSector/Thickness")
-    measurement_dict = {
-        laterality + "_Total_Thickness_" + el.tag: el[0].text for el in tot
-    }
-
-    two = measurement.find("TwoSectors")
-
-    for element in two.find("Thickness/GCL_IPL"):
-        measurement_dict[laterality + "_TwoSect_Thickness_GCL_IPL_" + element.tag] = (
-            element.text
-        )
-    for element in two.find("DifferenceSI/GCL_IPL"):
-        measurement_dict[
-            laterality + "_TwoSect_DifferenceSI_GCL_IPL_" + element.tag
-        ] = element.text
-    for element in two.find("Thickness/NFL_GCL_IPL"):
-        measurement_dict[
-            laterality + "_TwoSect_Thickness_NFL_GCL_IPL_" + element.tag
-        ] = element.text
-    for element in two.find("DifferenceSI/NFL_GCL_IPL"):
-        measurement_dict[
-            laterality + "_TwoSect_DifferenceSI_NFL_GCL_IPL_" + element.tag
-        ] = element.text
-
-    eight = measurement.find("EightSectors")
-    for element in eight.find("Thickness/GCL_IPL"):
-        measurement_dict[laterality + "_EightSect_Thickness_GCL_IPL_" + element.tag] = (
-            element.text
-        )
-    for element in eight.find("DifferenceSI/GCL_IPL"):
-        measurement_dict[
-            laterality + "_EightSect_DifferenceSI_GCL_IPL_" + element.tag
-        ] = element.text
-    for element in eight.find("Thickness/NFL_GCL_IPL"):
-        measurement_dict[
-            laterality + "_EightSect_Thickness_NFL_GCL_IPL_" + element.tag
-        ] = element.text
-    for element in eight.find("DifferenceSI/NFL_GCL_IPL"):
-        measurement_dict[
-            laterality + "_EightSect_DifferenceSI_NFL_GCL_IPL_" + element.tag
-        ] = element.text
-
-    return pinf_dict, ex_dict, measurement_dict
+    return _read_measurements(path, "Glaucoma3D")
 
 
 def read_macula_file(path):
@@ -141,137 +130,310 @@ def read_macula_file(path):
             - measurement_dict (dict): Dictionary containing macula measurement data.
                 The keys are formatted as "<laterality>_<MeasurementType>_<ILMType>_<ElementTag>".
     """
-    laterality, root, pinf_dict, ex_dict = _parse_common(path)
-    measurement = root.find("MaculaMeasurementData")
-    measurement_dict = {}
-    ETDRSSectors = measurement.find("ETDRSSectors")
-    for ilm_type in ETDRSSectors:
-        for element in ilm_type:
-            key = laterality + "_ETDRSSectors_" + ilm_type.tag + "_" + element.tag
-            measurement_dict[key] = element.text
-
-    FullRetinal = measurement.find("FullRetinalParameters")
-    for ilm_type in FullRetinal:
-        for element in ilm_type:
-            key = laterality + "_FullRetinal_" + ilm_type.tag + "_" + element.tag
-            measurement_dict[key] = element.text
-
-    return pinf_dict, ex_dict, measurement_dict
-
-
-def xml_to_df(path):
-    if "Disc3D" in path:
-        res = read_disc_file(path)
-    elif "Glaucoma3D" in path:
-        res = read_glaucoma_file(path)
-    elif "Macula3D" in path:
-        res = read_macula_file(path)
+    return _read_measurements(path, "Macula3D")
+
+
+_MEASUREMENT_SECTIONS = {
+    schema["section"]: scan_type for scan_type, schema in SCHEMAS.items()
+}
+
+
+def _stream_file(path, scan_type):
+    pid = os.path.dirname(path).split(os.sep)[-1]
+    laterality = path[-5]
+    extractor = get_extractor(scan_type, laterality)
+    info = {}
+    row = None
+    for _, elem in ET.iterparse(path):
+        tag = elem.tag
+        if tag == "PatientInformation":
+            info.update((p.tag, p.text) for p in elem if p.tag != "PatientNameGroup1")
+        elif tag == "ExaminationInformation":
+            info.update((el.tag, el.text) for el in elem)
+        elif tag == extractor.section:
+            row = extractor.extract(elem, path=path)
+        else:
+            continue
+        elem.clear()
+    if row is None:
+        row = extractor.extract(None, path=path)
+
+    if laterality != info.get("Laterality"):
+        print(
+            f"Error in {path} laterality {laterality} does not match {info.get('Laterality')}"
+        )
+    if pid != info.get("PatientID"):
+        print(f"Error in {path} pid {pid} does not match {info.get('PatientID')}")
+    info["PatientID"] = pid
+    return laterality, info, row
+
+
+def read_xml_streaming(path):
+    """
+    Reads a Disc3D, Glaucoma3D or Macula3D file in a single streaming pass.
+    Produces the same flattened key/value pairs as merging the dictionaries returned by
+    `read_disc_file`, `read_glaucoma_file` or `read_macula_file`, but never holds the full tree:
+    every top level section is flattened as soon as it is complete and then cleared.
+    Args:
+        path (str): The file path to the XML file.
+    Returns:
+        dict: Patient information, examination information and measurement data, with
+              "PatientID" set to the directory name.
+    """
+    scan_type = _scan_type(path)
+    laterality, info, row = _stream_file(path, scan_type)
+    return {**info, **dict(zip(get_extractor(scan_type, laterality).columns, row))}
+
+
+def _scan_type(path):
+    for scan_type in SCHEMAS:
+        if scan_type in path:
+            return scan_type
+    raise Exception("File not recognised")
+
+
+def _read_record(path, streaming=False):
+    """
+    Parses a single XML file into a compact record.
+    Args:
+        path (str): The file path to the XML file.
+        streaming (bool): Use the streaming reader instead of building the full ElementTree.
+    Returns:
+        tuple: A tuple containing:
+            - info (dict): Patient and examination information.
+            - layout (tuple): The (scan type, laterality) of the file, see `xml_schema.get_extractor`
+              for the names of the measurement columns.
+            - row (np.ndarray): The measurement values.
+    """
+    scan_type = _scan_type(path)
+    if streaming:
+        laterality, info, row = _stream_file(path, scan_type)
     else:
-        raise Exception("File not recognised")
+        laterality, root, pinf_dict, ex_dict = _parse_common(path)
+        extractor = get_extractor(scan_type, laterality)
+        row = extractor.extract(root.find(extractor.section), path=path)
+        info = {**pinf_dict, **ex_dict}
+    return info, (scan_type, laterality), row
 
-    res = {**res[0], **res[1], **res[2]}
-    res = pd.Series(res)
-    res["PatientBirthDate"] = pd.to_datetime(
-        res["PatientBirthDate"], format="%Y-00-00"
+
+def xml_to_df(path, streaming=False):
+    info, layout, row = _read_record(path, streaming)
+    info["PatientBirthDate"] = pd.to_datetime(
+        info["PatientBirthDate"], format="%Y-00-00"
     ).year
-    
-    res["ExaminationDate"] = pd.to_datetime(
-        res["ExaminationDateTime"], format="%Y-%m-%d"
-    ).date()
-    return res
+    exam_date = pd.to_datetime(info["ExaminationDateTime"], format="%Y-%m-%d")
+    return pd.Series(
+        [*info.values(), *row, exam_date],
+        index=[*info, *get_extractor(*layout).columns, "ExaminationDate"],
+        dtype=object,
+    )
 
 
-def _handle_same_date_scans(dfs):
+def _parse_files(paths, n_workers=1, chunksize=64, cache=None, streaming=False):
     """
-    Handles scans taken on the same date by separating them into left and right eye scans,
-    dropping retakes, and merging the results.
+    Runs `_read_record` over all given files, optionally fanned out over a process pool.
     Args:
-        dfs (list of pd.DataFrame): List of DataFrames, each containing scan data with columns
-                                    "ScanMode", "Laterality", "ExaminationDateTime", "ExaminationDate",
-                                    "PatientBirthDate", "PatientID", "PatientSex", "EthnicGroup",
-                                    "PatientComment", and "PatientDisease".
+        paths (list of str): The XML files to parse.
+        n_workers (int | None): Number of worker processes, 1 parses serially in this process,
+                                None uses all available cores.
+        chunksize (int): Number of files handed to a worker at once.
+        cache (xml_cache.XMLParseCache | None): Cache of earlier parse results, only files
+                                                 that are new or changed are parsed.
+        streaming (bool): Use the streaming reader instead of building the full ElementTree.
     Returns:
-        pd.DataFrame: A DataFrame containing the merged scan data for left and right eyes, with
-                      duplicate scans removed and unnecessary columns dropped.
-    Raises:
-        AssertionError: If the scan modes are not consistent across all DataFrames or if the laterality
-                        is not consistent within each DataFrame.
-        ValueError: If there is an issue with merging the left and right DataFrames.
-    """
-    left = []
-    right = []
-    scanmode = []
-    for df in dfs:
-        scanmode.append(df["ScanMode"][0])
-        if all(df["Laterality"] == "R"):
-            right.append(df)
-        else:
-            assert all(df["Laterality"] == "L")
-            left.append(df)
-    assert len(set(scanmode)) <= 1
-    right = pd.concat(right)
-    left = pd.concat(left)
-
-    def drop_retakes(df):
-        df = df.sort_values("ExaminationDateTime", ascending=True)
-        return df.drop_duplicates(
-            [
-                "ExaminationDate",
-                "PatientBirthDate",
-                "PatientID",
-                "PatientSex",
-                "EthnicGroup",
-            ],
-            keep="last",
-        )
+        list of tuple: The parsed records, in the same order as `paths`.
+    """
+    if cache is None:
+        to_parse = paths
+        results = [None] * len(paths)
+    else:
+        results = [cache.get(path) for path in paths]
+        to_parse = [path for path, res in zip(paths, results) if res is None]
+        # taken before parsing, so a file rewritten during the load is not cached as current
+        fingerprints = [cache.fingerprint(path) for path in to_parse]
+
+    parse = partial(_read_record, streaming=streaming)
+    if n_workers == 1 or len(to_parse) <= 1:
+        parsed = [parse(path) for path in to_parse]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            parsed = list(executor.map(parse, to_parse, chunksize=chunksize))
 
-    right = drop_retakes(right)
-    left = drop_retakes(left)
-
-    right = right.drop(
-        [
-            "Laterality",
-            "ScanMode",
-            "ExaminationDateTime",
-            "PatientComment",
-            "PatientDisease",
-        ],
-        axis="columns",
-        errors="ignore",
-    )
-    left = left.drop(
-        [
-            "Laterality",
-            "ScanMode",
-            "ExaminationDateTime",
-            "PatientComment",
-            "PatientDisease",
-        ],
-        axis="columns",
-        errors="ignore",
+    if cache is not None:
+        for path, res, fingerprint in zip(to_parse, parsed, fingerprints):
+            cache.put(path, res, fingerprint)
+        cache.evict()
+        cache.log_stats()
+    parsed = iter(parsed)
+    return [res if res is not None else next(parsed) for res in results]
+
+
+def _assemble_frame(records):
+    """
+    Builds one long-format DataFrame from the parsed records of a scan type, in one go instead
+    of one single-row frame per file. Every row is a single scan, the measurement columns are
+    filled from one preallocated matrix and carry no eye prefix, e.g. "FourSectors_Temporal",
+    the eye is given by the categorical "Laterality" column.
+    Args:
+        records (list of tuple): Records returned by `_read_record`, all of the same scan type.
+    Returns:
+        pd.DataFrame: The scans, rows in the same order as `records`.
+    """
+    if not records:
+        raise ValueError("No scans to assemble")
+    scan_type, laterality = records[0][1]
+    # the extractors of both eyes share their offsets, only the column prefix differs
+    columns = [
+        col[len(laterality) + 1 :] for col in get_extractor(scan_type, laterality).columns
+    ]
+    values = np.empty((len(records), len(columns)))
+    for i, (_, layout, row) in enumerate(records):
+        assert layout[0] == scan_type
+        values[i] = row
+    info = pd.DataFrame.from_records([info for info, _, _ in records])
+    info["Laterality"] = pd.Categorical(info["Laterality"], categories=["R", "L"])
+    exam_date = _normalise_dates(info)
+    measurements = pd.DataFrame(values, columns=columns)
+    # same column order as `xml_to_df`, with "ExaminationDate" last
+    return pd.concat([info, measurements, exam_date], axis=1)
+
+
+def _normalise_dates(info):
+    """
+    Converts the raw date strings of a batch of files in one column-wise pass.
+    "PatientBirthDate" is replaced by the birth year in place.
+    Args:
+        info (pd.DataFrame): Patient and examination information of the batch.
+    Returns:
+        pd.Series: The "ExaminationDate" column, as datetime64.
+    """
+    info["PatientBirthDate"] = pd.to_datetime(
+        info["PatientBirthDate"], format="%Y-00-00"
+    ).dt.year
+    return pd.to_datetime(info["ExaminationDateTime"], format="%Y-%m-%d").rename(
+        "ExaminationDate"
     )
 
-    try:
-        df = right.merge(
-            left,
-            on=[
-                "ExaminationDate",
-                "PatientBirthDate",
-                "PatientID",
-                "PatientSex",
-                "EthnicGroup",
-            ],
-            how="outer",
-            suffixes=(False, False),
-        )
-    except ValueError as e:
-        print(e)
-        print(right.columns)
-        print(left.columns)
-        raise e
+
+def add_age(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds "Age", the examination year minus the birth year, computed on the whole columns.
+    """
+    df["Age"] = df["ExaminationDate"].dt.year - df["PatientBirthDate"]
+    return df
+
+
+def add_time_since_onset(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds "time_since_onset", the number of days between the "Date of onset" and the
+    examination, NaN when the onset date is unknown.
+    """
+    delta = df["ExaminationDate"].to_numpy() - df["Date of onset"].to_numpy()
+    missing = np.isnat(delta)
+    days = np.where(missing, 0, delta) // np.timedelta64(1, "D")
+    df["time_since_onset"] = np.where(missing, np.nan, days)
     return df
 
 
+# derived columns that `load_data` adds on request
+DERIVED_COLUMNS = {
+    "Age": add_age,
+    "time_since_onset": add_time_since_onset,
+}
+
+
+_SCAN_KEYS = [
+    "ExaminationDate",
+    "PatientBirthDate",
+    "PatientID",
+    "PatientSex",
+    "EthnicGroup",
+]
+
+
+def _handle_same_date_scans(df):
+    """
+    Handles scans taken on the same date by keeping one scan of every eye per visit and
+    pivoting the left and right eye scans into a single row per visit. Of the retakes of an
+    eye, the one with the latest ExaminationDateTime is kept. That column only holds the date,
+    so the retakes of a visit tie, the tie is broken on the row order of `df`: the row that
+    comes last is kept. `patient_to_df` sorts the files on their path, so that is the retake
+    whose file path sorts last.
+    Args:
+        df (pd.DataFrame): Long-format scan data of a single scan type, as built by
+                           `_assemble_frame`, with columns "ScanMode", "Laterality",
+                           "ExaminationDateTime", "ExaminationDate", "PatientBirthDate",
+                           "PatientID", "PatientSex", "EthnicGroup", "PatientComment",
+                           "PatientDisease" and the measurements without eye prefix.
+    Returns:
+        pd.DataFrame: A DataFrame containing the scan data for left and right eyes, with
+                      duplicate scans removed and unnecessary columns dropped. The measurement
+                      columns are prefixed with "R_" or "L_" and the rows are sorted on the
+                      visit keys.
+    Raises:
+        AssertionError: If the scan modes are not consistent or if a laterality is not R or L.
+    """
+    assert df["ScanMode"].nunique() <= 1
+    assert df["Laterality"].notna().all()
+    df = df.reset_index(drop=True)
+
+    # integer code per visit, numbered in the sorted order of the visit keys
+    visit = df.groupby(_SCAN_KEYS, sort=True, dropna=False).ngroup().to_numpy()
+    eyes = df["Laterality"].cat.categories
+    eye = df["Laterality"].cat.codes.to_numpy()
+
+    # sort every eye on its own, stably, so of the retakes with the same ExaminationDateTime
+    # the last row is kept, whatever other patients are loaded alongside it
+    times = df["ExaminationDateTime"].to_numpy().astype(str)
+    order = []
+    for code in range(len(eyes)):
+        rows = np.flatnonzero(eye == code)
+        order.append(rows[np.argsort(times[rows], kind="stable")])
+    order = np.concatenate(order)
+    # keep the last scan of every eye per visit
+    order = order[
+        ~pd.Series(visit[order] * len(eyes) + eye[order]).duplicated(keep="last")
+    ]
+
+    info_columns = [
+        "Laterality",
+        "ScanMode",
+        "ExaminationDateTime",
+        "PatientComment",
+        "PatientDisease",
+    ]
+    measurements = [
+        col for col in df.columns if col not in info_columns and col not in _SCAN_KEYS
+    ]
+    # pivot the eyes next to each other, one row per visit
+    n_visits = visit.max() + 1 if len(visit) else 0
+    values = np.full((len(eyes), n_visits, len(measurements)), np.nan)
+    values[eye[order], visit[order]] = df[measurements].to_numpy(float)[order]
+    # any kept scan of a visit carries its keys
+    visit_rows = np.empty(n_visits, dtype=np.int64)
+    visit_rows[visit[order]] = order
+    keys = df[_SCAN_KEYS].take(visit_rows).reset_index(drop=True)
+
+    # the column layout of the former outer merge of the right eye scans with the left eye
+    # scans: the right eye columns in their original order, then the left eye measurements
+    present = [code for code in range(len(eyes)) if (eye[order] == code).any()]
+    wide = {}
+    for col in df.columns:
+        if col in _SCAN_KEYS:
+            wide[col] = keys[col]
+        elif col in measurements and present[0] == 0:
+            wide[f"{eyes[0]}_{col}"] = values[0, :, measurements.index(col)]
+    for code in present:
+        if code == 0:
+            continue
+        for i, col in enumerate(measurements):
+            wide[f"{eyes[code]}_{col}"] = values[code, :, i]
+    return pd.DataFrame(wide)
+
+
+_CATEGORY_COLUMNS = ["PatientID", "PatientSex", "EthnicGroup", "Laterality"]
+
+
 def fix_dtypes(
     df: pd.DataFrame,
     keep=[
@@ -281,22 +443,81 @@ def fix_dtypes(
         "ExaminationDate",
         "Target",
     ],
+    categories=_CATEGORY_COLUMNS,
+    nullable=False,
+    report=None,
 ):
-    for column in df.columns:
-        if column not in keep:
-            df[column] = pd.to_numeric(df[column])
+    """
+    Applies the compact dtype plan to a loaded frame:
+    the measurement columns are converted to float32 in one batched pass, integer columns
+    such as the birth year are downcast and the `categories` columns become categoricals.
+    Args:
+        df (pd.DataFrame): The frame to convert.
+        keep (list of str): Columns that are not converted to numbers.
+        categories (list of str): Columns converted to categoricals, when present.
+        nullable (bool): Store measurement columns with missing values as the nullable Float32
+                         dtype (missing values become pd.NA) instead of float32 with NaN.
+        report (list | None): Gets a "dtype plan" stage with the memory before and after.
+    Returns:
+        pd.DataFrame: The converted frame, with the same column order.
+    """
+    with _stage(report, "dtype plan", len(df)) as stage:
+        bytes_before = int(df.memory_usage(deep=True).sum())
+        columns = {col: df[col] for col in df.columns}
+        numeric = [
+            col for col in df.columns if col not in keep and col not in categories
+        ]
+        for col in numeric:
+            if not pd.api.types.is_numeric_dtype(columns[col]):
+                columns[col] = pd.to_numeric(columns[col])
+        floats = []
+        for col in numeric:
+            if pd.api.types.is_integer_dtype(columns[col]):
+                columns[col] = pd.to_numeric(columns[col], downcast="integer")
+            else:
+                floats.append(col)
+        values = np.empty((len(df), len(floats)), dtype=np.float32)
+        for i, col in enumerate(floats):
+            values[:, i] = columns[col]
+        missing = np.isnan(values)
+        for i, col in enumerate(floats):
+            if nullable and missing[:, i].any():
+                columns[col] = pd.arrays.FloatingArray(values[:, i], missing[:, i])
+            else:
+                columns[col] = values[:, i]
+        for col in categories:
+            if col in columns:
+                columns[col] = columns[col].astype("category")
+        df = pd.DataFrame(columns, index=df.index)
+
+        stage["rows_out"] = len(df)
+        stage["bytes_before"] = bytes_before
+        stage["bytes_after"] = int(df.memory_usage(deep=True).sum())
+        logger.info(
+            f"dtype plan: {bytes_before / 1024**2:.1f} MB -> "
+            f"{stage['bytes_after'] / 1024**2:.1f} MB"
+        )
     return df
 
 
-def patient_to_df(files):
+def patient_to_df(
+    files, n_workers=1, chunksize=64, cache=None, streaming=False, report=None
+):
     """
     Converts patient data from a list of XML files into a consolidated DataFrame.
     This function processes a list of file paths, categorizing them into Disc, Glaucoma, 
     and Macula groups based on the file names. It then converts each XML file into a 
-    DataFrame, handles scans taken on the same date, and merges the data into a single 
-    DataFrame.
+    DataFrame, handles scans taken on the same date, and joins the data into a single 
+    DataFrame with one row per visit. Of the retakes of an eye on the same date, the scan whose
+    file path sorts last is kept.
     Parameters:
     files (list): A list of file paths to the XML files containing patient data.
+    n_workers (int | None): Number of processes used to parse the files, see `_parse_files`.
+    chunksize (int): Number of files handed to a worker process at once.
+    cache (xml_cache.XMLParseCache | None): On-disk cache of parsed files, see `_parse_files`.
+    streaming (bool): Parse the files with `read_xml_streaming`, lowering peak memory per file.
+    report (list | None): When given, a dict with the row counts and duration of every stage
+                          is appended to it, see `_stage`.
     Returns:
     pandas.DataFrame: A DataFrame containing the consolidated patient data from the 
     provided XML files.
@@ -312,83 +533,288 @@ def patient_to_df(files):
             glauc.append(path)
         elif "Macula3D" in path:
             macula.append(path)
-    disc_dfs = [xml_to_df(file).to_frame().T for file in disc]
-    glauc_dfs = [xml_to_df(file).to_frame().T for file in glauc]
-    macula_dfs = [xml_to_df(file).to_frame().T for file in macula]
-    disc = _handle_same_date_scans(disc_dfs)
-    glauc = _handle_same_date_scans(glauc_dfs)
-    macula = _handle_same_date_scans(macula_dfs)
-    df = disc.merge(
-        glauc,
-        on=[
-            "ExaminationDate",
-            "PatientBirthDate",
-            "PatientID",
-            "PatientSex",
-            "EthnicGroup",
-        ],
-        how="outer",
-        suffixes=(False, False),
-    )
-    df = df.merge(
-        macula,
-        on=[
-            "ExaminationDate",
-            "PatientBirthDate",
-            "PatientID",
-            "PatientSex",
-            "EthnicGroup",
-        ],
-        how="outer",
-        suffixes=(False, False),
-    )
+    # the retakes of a visit are told apart by their file path, see `_handle_same_date_scans`,
+    # so the result does not depend on the order in which the file system lists the files
+    paths = sorted(disc) + sorted(glauc) + sorted(macula)
+    # parse all modalities in one go so the worker pool is only started once
+    with _stage(report, "parse", len(paths)) as stage:
+        parsed = _parse_files(paths, n_workers, chunksize, cache, streaming)
+        stage["rows_out"] = len(parsed)
+
+    frames = []
+    offset = 0
+    for name, n_files in [
+        ("Disc3D", len(disc)),
+        ("Glaucoma3D", len(glauc)),
+        ("Macula3D", len(macula)),
+    ]:
+        if n_files == 0:
+            # a batch of patients can miss a modality, see `_load_xml_chunked`
+            continue
+        with _stage(report, f"same date scans {name}", n_files) as stage:
+            df = _assemble_frame(parsed[offset : offset + n_files])
+            df = _handle_same_date_scans(df)
+            stage["rows_out"] = len(df)
+        frames.append(df)
+        offset += n_files
+    if not frames:
+        raise ValueError("No scans to assemble")
+
+    with _stage(report, "join modalities", sum(len(df) for df in frames)) as stage:
+        df = join_modalities(frames, _SCAN_KEYS)
+        stage["rows_out"] = len(df)
+    return df
+
 
+def _reset_peak_rss():
+    """
+    Resets the peak resident memory of this process, so `_peak_rss` reports the peak since the
+    reset. Returns False when the platform does not support it (only Linux does).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss():
+    """
+    Returns the peak resident memory in bytes of this process since the last `_reset_peak_rss`,
+    or None when the platform does not report it. Worker processes are not included.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return 1024 * int(line.split()[1])  # in kB
+    except OSError:
+        pass
+    return None
+
+
+def _patient_batches(files, max_memory):
+    """
+    Groups the xml files per patient directory and packs whole patients into batches whose
+    estimated peak memory stays below `max_memory`. A patient that does not fit on its own
+    gets a batch of its own, patients are never split over batches.
+    Args:
+        files (iterable of str or Path): The xml files.
+        max_memory (int): Memory budget of a batch in bytes.
+    Returns:
+        list of list of str: The files of every batch.
+    """
+    patients = {}
+    for path in files:
+        path = str(path)
+        pid = os.path.dirname(path).split(os.sep)[-1]
+        patients.setdefault(pid, []).append(path)
+
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for pid in sorted(patients):
+        patient_bytes = _MEMORY_PER_XML_BYTE * sum(
+            os.path.getsize(path) for path in patients[pid]
+        )
+        if batch and batch_bytes + patient_bytes > max_memory:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.extend(patients[pid])
+        batch_bytes += patient_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _load_xml_chunked(
+    files,
+    max_memory,
+    spill_dir=None,
+    n_workers=1,
+    chunksize=64,
+    cache=None,
+    streaming=False,
+    report=None,
+):
+    """
+    Out-of-core variant of `patient_to_df` followed by `fix_dtypes`, which is applied to every
+    batch before it is spilled to keep the spills small. The patients are processed in batches
+    that fit in `max_memory`, see `_patient_batches`. Every batch is parsed, deduplicated and
+    joined on its own and spilled to a Parquet file, the spilled batches are combined at the
+    end. Since a patient is always in a single batch, the same date scans are handled exactly as
+    when all files are loaded at once.
+
+    Only the parsing of a batch is bounded by `max_memory`. The combined frame has to fit in
+    memory, `snapshot.combine_spills` builds it column by column so the combine step needs
+    little more than the result itself.
+    Args:
+        files (iterable of str or Path): The xml files.
+        max_memory (int): Memory budget of a batch in bytes.
+        spill_dir (str | None): Directory for the spilled batches, a temporary directory that is
+                                removed afterwards when None.
+        n_workers, chunksize, cache, streaming, report: See `patient_to_df`.
+    Returns:
+        pd.DataFrame: The same frame as the in-memory path after `fix_dtypes`, with the rows in
+                      the same order.
+    """
+    batches = _patient_batches(files, max_memory)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp_dir:
+        spills = []
+        for i, batch in enumerate(batches):
+            with _stage(report, f"batch {i + 1}/{len(batches)}", len(batch)) as stage:
+                peak_reset = _reset_peak_rss()
+                df = patient_to_df(batch, n_workers, chunksize, cache, streaming, report)
+                # categoricals are only added once the batches are combined, so all batches
+                # share their categories
+                df = fix_dtypes(df, categories=[], report=report)
+                spill = os.path.join(tmp_dir, f"batch_{i:05d}.parquet")
+                snapshot.write_spill(df, spill)
+                spills.append(spill)
+                stage["rows_out"] = len(df)
+                stage["frame_bytes"] = int(df.memory_usage(deep=True).sum())
+                stage["peak_rss_bytes"] = _peak_rss() if peak_reset else None
+                del df
+        with _stage(report, "combine batches", len(spills)) as stage:
+            peak_reset = _reset_peak_rss()
+            df = snapshot.combine_spills(spills, _SCAN_KEYS, _CATEGORY_COLUMNS)
+            stage["rows_out"] = len(df)
+            stage["frame_bytes"] = int(df.memory_usage(deep=True).sum())
+            stage["peak_rss_bytes"] = _peak_rss() if peak_reset else None
     return df
 
 
-def load_xml_data(path):
+def load_xml_data(
+    path,
+    n_workers=1,
+    chunksize=64,
+    cache=None,
+    snapshot_path=None,
+    streaming=False,
+    report=None,
+    max_memory=None,
+    spill_dir=None,
+):
+    """
+    Loads the xml files below `path` into one row per visit.
+    Args:
+        path (str): Path to the xml files directory.
+        n_workers, chunksize, cache, streaming, report: See `patient_to_df`.
+        snapshot_path (str | None): Parquet snapshot of the result, see `load_data`.
+        max_memory (int | None): When given, the patients are parsed in batches that each stay
+                                 below this many bytes, the combined result still has to fit in
+                                 memory, see `_load_xml_chunked`. The peak memory of every batch
+                                 is added to `report`.
+        spill_dir (str | None): Where the batches are spilled to in the chunked mode.
+    Returns:
+        pd.DataFrame: The xml data.
+    """
+    if snapshot_path is not None:
+        source = snapshot.xml_tree_signature(path)
+        if snapshot.is_snapshot_fresh(snapshot_path, source):
+            with _stage(report, "read snapshot", None) as stage:
+                df = snapshot.read_snapshot(snapshot_path)
+                stage["rows_out"] = len(df)
+            return df
     xml_file_loc = Path(path)
-    df = patient_to_df(xml_file_loc.glob("**/*.xml"))
-    df = fix_dtypes(df)
+    if max_memory is not None:
+        df = _load_xml_chunked(
+            xml_file_loc.glob("**/*.xml"),
+            max_memory,
+            spill_dir,
+            n_workers,
+            chunksize,
+            cache,
+            streaming,
+            report,
+        )
+    else:
+        df = patient_to_df(
+            xml_file_loc.glob("**/*.xml"), n_workers, chunksize, cache, streaming, report
+        )
+        df = fix_dtypes(df, report=report)
+    if snapshot_path is not None:
+        with _stage(report, "write snapshot", len(df)) as stage:
+            snapshot.write_snapshot(df, snapshot_path, source)
+            df = snapshot.read_snapshot(snapshot_path)
+            stage["rows_out"] = len(df)
     return df
 
 
-def load_data(xml_path, imed_path) -> pd.DataFrame:
+def load_data(
+    xml_path,
+    imed_path,
+    n_workers=1,
+    chunksize=64,
+    cache=None,
+    snapshot_path=None,
+    report=None,
+    max_memory=None,
+    derived_columns=None,
+    imed_store=None,
+    visit_direction=None,
+    visit_tolerance=None,
+) -> pd.DataFrame:
     """
     Get all the data from the xml and imed files and combine them into a single dataframe.
         xml_path (str): Path to the xml files directory.
         imed_path (str): Path to the imed file.
+        n_workers (int | None): Number of processes used to parse the xml files.
+        chunksize (int): Number of xml files handed to a worker process at once.
+        cache (xml_cache.XMLParseCache | None): Cache of parsed xml files, so a reload only
+                                                 parses new or changed files.
+        snapshot_path (str | None): Parquet snapshot of the xml data, read instead of the xml
+                                    files when it is up to date and (re)written otherwise.
+        report (list | None): When given, the row counts and duration of every loading stage
+                              are appended to it as dicts with the keys "stage", "rows_in",
+                              "rows_out" and "seconds", showing where visits get dropped.
+        max_memory (int | None): Load the xml files in patient batches that stay below this
+                                 many bytes, see `load_xml_data`.
+        derived_columns (list of str | None): Columns of `DERIVED_COLUMNS` to add, e.g.
+                                              ["Age", "time_since_onset"].
+        imed_store (imed_store.IMEDStore | None): Columnar cache of the imed workbook, so a
+                                                  reload does not read the workbook again.
+        visit_direction (str | None): None joins exams to visits on the same date only.
+                                      "nearest", "backward" or "forward" joins every exam to the
+                                      closest visit in that direction, see `joins.join_imed`.
+        visit_tolerance (pd.Timedelta | str | None): Largest distance between an exam and its
+                                                     visit for `visit_direction`, e.g. "30D".
     Returns:
         pd.DataFrame: A dataframe containing the combined data from the xml and imed files.
     """
-    xml_df = load_xml_data(xml_path)
-    imed_df_dict = pd.read_excel(Path(imed_path), sheet_name=None)
-    imed_df = imed_df_dict["Identification"][
-        ["Patient ID", "Birth Date", "Date of onset"]
-    ]
-    imed_df.loc[:, "Date of onset"] = pd.to_datetime(
-        imed_df.loc[:, "Date of onset"], format="%d.%m.%Y"
-    ).apply(lambda x: x.date())
-
-    visist_df = imed_df_dict["Visits"]
-    visist_df.loc[:, "Visit Date"] = pd.to_datetime(
-        visist_df.loc[:, "Visit Date"], format="%d.%m.%Y"
-    ).apply(lambda x: x.date())
-
-    visist_df = visist_df[["Patient ID", "Visit Date", "EDSS"]]
-    df = pd.merge(xml_df, imed_df, left_on="PatientID", right_on="Patient ID").drop(
-        ["Patient ID", "Birth Date"], axis=1
-    )
-    df = pd.merge(
-        df,
-        visist_df,
-        left_on=["PatientID", "ExaminationDate"],
-        right_on=["Patient ID", "Visit Date"],
-        how="inner",
-    ).drop(["Patient ID", "Visit Date"], axis=1)
-
-    df.loc[:, "EDSS"] = df["EDSS"].apply(
-        lambda x: float(x.replace(",", ".")) if not pd.isnull(x) else np.nan
+    xml_df = load_xml_data(
+        xml_path,
+        n_workers,
+        chunksize,
+        cache,
+        snapshot_path,
+        report=report,
+        max_memory=max_memory,
     )
+    with _stage(report, "read imed", None) as stage:
+        if imed_store is not None:
+            sheets = imed_store.read(imed_path)
+        else:
+            sheets = read_imed_workbook(imed_path)
+        imed_df = sheets["Identification"]
+        visist_df = sheets["Visits"]
+        stage["rows_out"] = len(visist_df)
+        stage["rows_identification"] = len(imed_df)
+
+    with _stage(report, "join imed", len(xml_df)) as stage:
+        df, (n_identified, n_visits) = join_imed(
+            xml_df, imed_df, visist_df, visit_tolerance, visit_direction
+        )
+        stage["rows_out"] = n_visits
+        stage["rows_identified"] = n_identified
+
+    for name in derived_columns or []:
+        if name not in DERIVED_COLUMNS:
+            raise ValueError(
+                f"Unknown derived column {name}, expected one of {list(DERIVED_COLUMNS)}"
+            )
+        df = DERIVED_COLUMNS[name](df)
 
     return df
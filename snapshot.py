@@ -0,0 +1,185 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from filter_data import _GLUACOMA_COLUMNS, _MACULA_COLUMNS, _ONH_COLUMNS, _RNFL_COLUMNS
+
+# bump when the layout of the snapshot changes, older snapshots are then rebuilt
+SNAPSHOT_VERSION = 2
+
+_METADATA_KEY = b"oct_snapshot"
+
+COLUMN_GROUPS = {
+    "RNFL": _RNFL_COLUMNS,
+    "ONH": _ONH_COLUMNS,
+    "GLAUCOMA": _GLUACOMA_COLUMNS,
+    "MACULA": _MACULA_COLUMNS,
+}
+
+
+def xml_tree_signature(xml_path):
+    """
+    Summarises the XML export so a snapshot can tell whether it is still up to date.
+    Args:
+        xml_path (str): Path to the xml files directory.
+    Returns:
+        dict: The number of files, their total size and the most recent modification time.
+    """
+    n_files = 0
+    total_size = 0
+    max_mtime = 0
+    for path in Path(xml_path).glob("**/*.xml"):
+        stat = path.stat()
+        n_files += 1
+        total_size += stat.st_size
+        max_mtime = max(max_mtime, stat.st_mtime_ns)
+    return {"n_files": n_files, "total_size": total_size, "max_mtime_ns": max_mtime}
+
+
+def write_snapshot(df: pd.DataFrame, path, source=None):
+    """
+    Writes the merged OCT dataset to a Parquet snapshot.
+    All measurement columns of `COLUMN_GROUPS` are stored as float32, the column groups, the
+    snapshot version and the `source` signature are stored in the file metadata.
+    Args:
+        df (pd.DataFrame): The frame returned by `load_data.load_xml_data`.
+        path (str): Path of the snapshot file.
+        source (dict | None): Signature of the data the snapshot was built from,
+                              see `xml_tree_signature`.
+    """
+    groups = {
+        group: [col for col in columns if col in df.columns]
+        for group, columns in COLUMN_GROUPS.items()
+    }
+    measurements = [col for columns in groups.values() for col in columns]
+    df = df.astype({col: np.float32 for col in measurements})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        "version": SNAPSHOT_VERSION,
+        "column_groups": groups,
+        "source": source,
+    }
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            _METADATA_KEY: json.dumps(metadata).encode("utf-8"),
+        }
+    )
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, path)
+
+
+def read_snapshot_metadata(path):
+    """
+    Reads only the footer of a snapshot and returns its metadata, or None if there is none.
+    """
+    metadata = pq.read_schema(path).metadata or {}
+    if _METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[_METADATA_KEY])
+
+
+def is_snapshot_fresh(path, source=None):
+    """
+    Checks that the snapshot exists, has the current version and was built from `source`.
+    """
+    if not Path(path).exists():
+        return False
+    metadata = read_snapshot_metadata(path)
+    if metadata is None or metadata["version"] != SNAPSHOT_VERSION:
+        return False
+    return source is None or metadata["source"] == source
+
+
+def write_spill(df: pd.DataFrame, path):
+    """
+    Writes one batch of the chunked loading mode to a Parquet file, without any conversion.
+    """
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def combine_spills(paths, sort_keys, categories=()) -> pd.DataFrame:
+    """
+    Combines the batches written by `write_spill` into a single frame, sorted on `sort_keys`
+    like the frame that is loaded in one go. Columns that are missing from a batch are filled
+    with nulls and put in the order of the widest batch.
+
+    The frame is built one column at a time: the row order is computed on the key columns only,
+    then every column is read from all batches, reordered and written into the result, with the
+    float32 columns going straight into one preallocated block. Peak memory is the result plus
+    a single column of the batches, instead of several copies of the whole dataset.
+    Args:
+        paths (list of str): The spilled batches.
+        sort_keys (list of str): Columns the rows are sorted on, nulls last.
+        categories (list of str): Columns converted to categoricals, when present.
+    Returns:
+        pd.DataFrame: The combined batches.
+    """
+    files = [pq.ParquetFile(path) for path in paths]
+    schemas = [pf.schema_arrow for pf in files]
+    columns = list(max(schemas, key=len).names)
+    for schema in schemas:
+        columns.extend(col for col in schema.names if col not in columns)
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+
+    keys = pa.concat_tables(
+        [pf.read(columns=sort_keys) for pf in files], promote_options="permissive"
+    )
+    # nulls are placed last by default, as in the groupby of `load_data._handle_same_date_scans`
+    order = pc.sort_indices(keys, sort_keys=[(key, "ascending") for key in sort_keys])
+    del keys
+
+    def read_column(col):
+        field = schema.field(col)
+        chunks = []
+        for pf, batch_schema in zip(files, schemas):
+            if col in batch_schema.names:
+                chunks.append(pf.read(columns=[col]).column(col).cast(field.type))
+            else:
+                chunks.append(pa.nulls(pf.metadata.num_rows, field.type))
+        return pa.chunked_array(
+            [chunk for array in chunks for chunk in getattr(array, "chunks", [array])],
+            field.type,
+        ).take(order)
+
+    floats = [col for col in columns if schema.field(col).type == pa.float32()]
+    values = np.empty((len(floats), len(order)), dtype=np.float32)
+    for i, col in enumerate(floats):
+        values[i] = read_column(col).to_numpy()
+    df = pd.DataFrame(values.T, columns=floats, copy=False)
+    # the other columns are inserted around the float32 block, which is not copied
+    for loc, col in enumerate(columns):
+        if col not in floats:
+            series = read_column(col).to_pandas()
+            if col in categories:
+                series = series.astype("category")
+            df.insert(loc, col, series)
+    return df
+
+
+def read_snapshot(path, groups=None) -> pd.DataFrame:
+    """
+    Reads a snapshot written by `write_snapshot`.
+    Args:
+        path (str): Path of the snapshot file.
+        groups (list of str | str | None): Column groups to read, e.g. "RNFL". The patient and
+                                           examination columns are always read, the columns of
+                                           other groups are never deserialized. None reads all.
+    Returns:
+        pd.DataFrame: The (selected part of the) merged OCT dataset.
+    """
+    columns = None
+    if groups is not None:
+        if isinstance(groups, str):
+            groups = [groups]
+        stored_groups = read_snapshot_metadata(path)["column_groups"]
+        measurements = {col for cols in stored_groups.values() for col in cols}
+        columns = [col for col in pq.read_schema(path).names if col not in measurements]
+        for group in groups:
+            columns.extend(stored_groups[group])
+    return pq.read_table(path, columns=columns).to_pandas()
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from filter_data import (  # noqa: E402
+    _COLUMN_GROUPS,
+    FeatureView,
+    filter_GLAUCOMA_groups,
+    filter_groups,
+    filter_MACULA_groups,
+)
+
+
+def _frame():
+    columns = _COLUMN_GROUPS["MACULA"] + _COLUMN_GROUPS["GLAUCOMA"]
+    return pd.DataFrame(np.zeros((2, len(columns))), columns=columns)
+
+
+def test_tuple_selects_several_sectors():
+    df = _frame()
+    res = filter_groups(df, {"MACULA": ("Central", "ParaNasal")})
+    expected = filter_MACULA_groups(df, ("Central", "ParaNasal"), "both")
+    assert list(res.columns) == list(expected.columns)
+    macula = res.columns[res.columns.isin(_COLUMN_GROUPS["MACULA"])]
+    assert len(macula) == 8
+    assert macula.str.contains("Central|ParaNasal").all()
+
+
+def test_layers_are_given_by_name():
+    df = _frame()
+    res = filter_groups(df, {"GLAUCOMA": {"sectors": "Superior", "layers": "GCL_IPL"}})
+    expected = filter_GLAUCOMA_groups(df, "Superior", "GCL_IPL")
+    assert list(res.columns) == list(expected.columns)
+
+
+def test_unknown_layer_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        filter_groups(_frame(), {"MACULA": {"sector": "Central"}})
+
+
+def test_view_matches_filter_groups():
+    df = _frame()
+    view = FeatureView(df).MACULA(["Central", "ParaNasal"], "ILM_BM")
+    expected = filter_MACULA_groups(df, ["Central", "ParaNasal"], "ILM_BM")
+    assert view.columns == list(expected.columns)
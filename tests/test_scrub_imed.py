@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "Anonimization"))
+
+from scrub_imed import (  # noqa: E402
+    ID_COLUMNS,
+    match_patients,
+    normalise_identification,
+    normalise_mapping,
+    read_imed_sheets,
+)
+
+
+def _mapping():
+    return pd.DataFrame(
+        {
+            "PatientID": ["001", "002", "003"],
+            "UnifiedPatientID": ["U1", "U2", "U3"],
+            "FamilyName": ["DOE", "Smith", "Peeters"],
+            "GivenName": ["John", "Anna", "Jan"],
+            "PatientBirthDate": ["1980-02-03", "1975-12-31", "1990-06-15"],
+            "PatientSex": ["M", "F", "M"],
+        }
+    )
+
+
+def _identification():
+    return pd.DataFrame(
+        {
+            "Patient ID": [101, 102, 103, 104],
+            "Last Name": ["Doe", "Smith", "Peeters", "Other"],
+            "First Name": ["john", "ANNA", "Jan", "Someone"],
+            # Jan Peeters has a different birth date in iMED and must not be matched
+            "Birth Date": ["03.02.1980", "31.12.1975", "16.06.1990", "01.01.1960"],
+            "Gender": ["M", "F", "M", "F"],
+            "Date of onset": ["01.01.2010", "01.01.2011", "01.01.2012", "01.01.2013"],
+        }
+    )
+
+
+def _write_inputs(tmp_path):
+    # the mapping csv and iMED workbook as scrub_imed reads them
+    csv_path = tmp_path / "mapping.csv"
+    _mapping().to_csv(csv_path, index=False)
+    imed_path = tmp_path / "imed.xlsx"
+    with pd.ExcelWriter(imed_path) as writer:
+        _identification().to_excel(writer, sheet_name="Identification", index=False)
+    return csv_path, imed_path
+
+
+def _matched(tmp_path):
+    csv_path, imed_path = _write_inputs(tmp_path)
+    id_df = normalise_mapping(pd.read_csv(csv_path))
+    sheets = read_imed_sheets(imed_path, {"Identification": ID_COLUMNS})
+    return match_patients(id_df, normalise_identification(sheets["Identification"]))
+
+
+def test_patients_match_on_name_sex_and_birth_date(tmp_path):
+    merged_id = _matched(tmp_path)
+    assert dict(zip(merged_id["Patient ID"], merged_id["UnifiedPatientID"])) == {
+        101: "U1",
+        102: "U2",
+    }
+
+
+def test_birth_dates_are_compared_as_dates(tmp_path):
+    merged_id = _matched(tmp_path)
+    assert (merged_id["PatientBirthDate"] == merged_id["Birth Date"]).all()
+    assert list(merged_id["Birth Date"].dt.strftime("%Y-%m-%d")) == [
+        "1980-02-03",
+        "1975-12-31",
+    ]
+
+
+def test_normalisation_does_not_modify_its_input():
+    id_df = _mapping()
+    identification = _identification()
+    normalise_mapping(id_df)
+    normalise_identification(identification)
+    pd.testing.assert_frame_equal(id_df, _mapping())
+    pd.testing.assert_frame_equal(identification, _identification())
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import pickle
+import time
+
+logger = logging.getLogger(__name__)
+
+# bump when the layout of the cached records changes, older entries then count as misses
+CACHE_FORMAT = 3
+
+
+class XMLParseCache:
+    """
+    On-disk cache for the parsed records of `load_data._read_record`.
+
+    Every XML file gets one entry, named after the hash of its absolute path. The entry stores
+    a fingerprint of the file (size and mtime, or the sha1 of its content when `use_hash` is set)
+    next to the parsed result, a lookup only counts as a hit when the fingerprint still matches.
+    When the cache grows beyond `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3, use_hash=False):
+        """
+        Args:
+            cache_dir (str): Directory the cache entries are stored in, created if missing.
+            max_bytes (int | None): Size limit of the cache directory, None disables eviction.
+            use_hash (bool): Fingerprint files on their content instead of size and mtime,
+                             files that are touched or copied without changes then stay cached.
+        """
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # entry name -> [size in bytes, last use], seeded from the files already on disk
+        self._entries = {}
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                self._entries[entry.name] = [stat.st_size, stat.st_mtime]
+
+    def _entry_name(self, path):
+        return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest() + ".pkl"
+
+    def fingerprint(self, path):
+        """
+        Returns the current fingerprint of `path`, to be taken before the file is parsed and
+        handed to `put`.
+        """
+        if self.use_hash:
+            with open(path, "rb") as f:
+                return (CACHE_FORMAT, hashlib.sha1(f.read()).hexdigest())
+        stat = os.stat(path)
+        return (CACHE_FORMAT, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, path):
+        """
+        Returns the cached result for `path`, or None when the file is new or has changed.
+        """
+        name = self._entry_name(path)
+        if name not in self._entries:
+            self.misses += 1
+            return None
+        entry_path = os.path.join(self.cache_dir, name)
+        try:
+            with open(entry_path, "rb") as f:
+                fingerprint, res = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._remove(name)
+            self.misses += 1
+            return None
+        if fingerprint != self.fingerprint(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # bump the entry's mtime so the LRU order survives between sessions
+        now = time.time()
+        os.utime(entry_path, (now, now))
+        self._entries[name][1] = now
+        return res
+
+    def put(self, path, res, fingerprint):
+        """
+        Stores the parsed result of `path`, replacing any older entry for the same file.
+        Args:
+            path (str): The parsed file.
+            res: Its parsed result.
+            fingerprint (tuple): The `fingerprint` of the file taken before it was parsed. When
+                                 the file changed since then, the entry is skipped, otherwise a
+                                 parse of the old content would be served as current.
+        """
+        if fingerprint != self.fingerprint(path):
+            logger.debug(f"xml parse cache: {path} changed while it was parsed, not cached")
+            return
+        name = self._entry_name(path)
+        entry_path = os.path.join(self.cache_dir, name)
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((fingerprint, res), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+        stat = os.stat(entry_path)
+        self._entries[name] = [stat.st_size, stat.st_mtime]
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+        """
+        if self.max_bytes is None:
+            return
+        total = self.size_bytes()
+        if total <= self.max_bytes:
+            return
+        for name, (size, _) in sorted(self._entries.items(), key=lambda x: x[1][1]):
+            self._remove(name)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def invalidate(self, path):
+        """
+        Drops the entry of a single file so it is parsed again on the next load.
+        """
+        self._remove(self._entry_name(path))
+
+    def clear(self):
+        """
+        Drops all entries.
+        """
+        for name in list(self._entries):
+            self._remove(name)
+
+    def _remove(self, name):
+        self._entries.pop(name, None)
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def size_bytes(self):
+        return sum(size for size, _ in self._entries.values())
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes(),
+        }
+
+    def log_stats(self, level=logging.INFO):
+        stats = self.stats()
+        logger.log(
+            level,
+            f"xml parse cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['evictions']} evictions, {stats['entries']} entries "
+            f"({stats['size_bytes'] / 1024**2:.1f} MB)",
+        )
@@ -0,0 +1,233 @@
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+from filter_data import _GLUACOMA_COLUMNS, _MACULA_COLUMNS, _ONH_COLUMNS, _RNFL_COLUMNS
+
+_RNFL_FOUR_SECTORS = ["Temporal", "Superior", "Nasal", "Inferior"]
+_RNFL_TWELVE_SECTORS = [
+    "Temporal",
+    "TemporalSuperiorTemporal",
+    "SuperiorSuperiorTemporal",
+    "Superior",
+    "SuperiorSuperiorNasal",
+    "NasalSuperiorNasal",
+    "Nasal",
+    "NasalInferiorNasal",
+    "InferiorInferiorNasal",
+    "Inferior",
+    "InferiorInferiorTemporal",
+    "TemporalInferiorTemporal",
+]
+_ONH_PARAMETERS = [
+    "DiscArea",
+    "RimArea",
+    "CupVolume",
+    "RimVolume",
+    "CDArea",
+    "CDVertical",
+    "CDHorizontal",
+    "RDMinimum",
+    "RimAbsence",
+    "DDLS",
+]
+_GCL_TWO_SECTORS = ["Superior", "Inferior"]
+_GCL_EIGHT_SECTORS = [
+    "ParaInferiorNasal",
+    "ParaInferiorTemporal",
+    "ParaSuperiorTemporal",
+    "ParaSuperiorNasal",
+    "PeriInferiorNasal",
+    "PeriInferiorTemporal",
+    "PeriSuperiorTemporal",
+    "PeriSuperiorNasal",
+]
+_ETDRS_SECTORS = [
+    "ParaTemporal",
+    "PeriTemporal",
+    "ParaNasal",
+    "PeriNasal",
+    "ParaSuperior",
+    "PeriSuperior",
+    "ParaInferior",
+    "PeriInferior",
+    "Central",
+]
+
+
+def _glaucoma_sector_groups(sector, prefix, tags):
+    return [
+        (f"{sector}/{kind}/{layer}", tags, f"{prefix}_{kind}_{layer}", False)
+        for layer in ["GCL_IPL", "NFL_GCL_IPL"]
+        for kind in ["Thickness", "DifferenceSI"]
+    ]
+
+
+# Every scan type lists its measurement section and the groups inside it as
+# (path in the section, child tags, column name prefix, value in the first grandchild).
+# A column is named "<laterality>_<prefix>_<tag>".
+SCHEMAS = {
+    "Disc3D": {
+        "section": "DiscMeasurementData",
+        "columns": _RNFL_COLUMNS + _ONH_COLUMNS,
+        "groups": [
+            ("FourSectors", _RNFL_FOUR_SECTORS, "FourSectors", False),
+            ("TwelveSectors", _RNFL_TWELVE_SECTORS, "TwelveSectors", False),
+            (
+                "RNFLParameters",
+                ["TSNITAverage", "StandardDeviation"],
+                "RNFLParameters",
+                False,
+            ),
+            ("ONHParameters", _ONH_PARAMETERS, "ONHParameters", False),
+        ],
+    },
+    "Glaucoma3D": {
+        "section": "GlaucomaMeasurementData",
+        "columns": _GLUACOMA_COLUMNS,
+        "groups": [
+            (
+                "TotalSector/Thickness",
+                ["GCL_IPL", "NFL_GCL_IPL"],
+                "Total_Thickness",
+                True,
+            ),
+            *_glaucoma_sector_groups("TwoSectors", "TwoSect", _GCL_TWO_SECTORS),
+            *_glaucoma_sector_groups("EightSectors", "EightSect", _GCL_EIGHT_SECTORS),
+        ],
+    },
+    "Macula3D": {
+        "section": "MaculaMeasurementData",
+        "columns": _MACULA_COLUMNS,
+        "groups": [
+            (f"{block}/{layer}", tags, f"{prefix}_{layer}", False)
+            for block, prefix, tags in [
+                ("ETDRSSectors", "ETDRSSectors", _ETDRS_SECTORS),
+                (
+                    "FullRetinalParameters",
+                    "FullRetinal",
+                    ["Minimum", "Average", "Volume"],
+                ),
+            ]
+            for layer in ["ILM_RPE", "ILM_BM"]
+        ],
+    },
+}
+
+
+class SchemaDriftWarning(UserWarning):
+    """
+    Emitted when a scan file does not match the schema of its scan type.
+    Attributes:
+        path (str): The file that drifted.
+        scan_type (str): "Disc3D", "Glaucoma3D" or "Macula3D".
+        kind (str): "missing" for schema tags that are not in the file, "unknown" for tags in the
+                    file that the schema does not know, "invalid" for values that are not numbers.
+        tags (list of str): The affected tags, as paths inside the measurement section.
+    """
+
+    def __init__(self, path, scan_type, kind, tags):
+        self.path = path
+        self.scan_type = scan_type
+        self.kind = kind
+        self.tags = tags
+        super().__init__(f"{scan_type} file {path}: {kind} tags {', '.join(tags)}")
+
+
+class CompiledExtractor:
+    """
+    Extractor for one scan type and laterality, compiled from its schema.
+    `columns` holds the output column names, `extract` writes the measurement values into a
+    float row at the fixed offset of every column.
+    """
+
+    def __init__(self, scan_type, laterality):
+        schema = SCHEMAS[scan_type]
+        self.scan_type = scan_type
+        self.section = schema["section"]
+        self.columns = []
+        # (group path, {tag: column offset}, value in the first grandchild)
+        self._groups = []
+        for group_path, tags, prefix, first_child in schema["groups"]:
+            offsets = {}
+            for tag in tags:
+                offsets[tag] = len(self.columns)
+                self.columns.append(f"{laterality}_{prefix}_{tag}")
+            self._groups.append((group_path, offsets, first_child))
+        self._top_tags = {group[0].split("/")[0] for group in schema["groups"]}
+
+        expected = {
+            col for col in schema["columns"] if col.startswith(laterality + "_")
+        }
+        if laterality in ("R", "L") and set(self.columns) != expected:
+            raise ValueError(
+                f"{scan_type} schema does not match the filter_data columns: "
+                f"{sorted(set(self.columns) ^ expected)}"
+            )
+
+    def extract(self, measurement, row=None, path=None):
+        """
+        Fills `row` with the values of a measurement section.
+        Args:
+            measurement (xml.etree.ElementTree.Element | None): The measurement section element.
+            row (np.ndarray | None): Float row of len(columns) to fill, allocated when None.
+                                     Values that are missing from the file are left untouched.
+            path (str | None): File the section was read from, used in the drift warnings.
+        Returns:
+            np.ndarray: The filled row.
+        """
+        if row is None:
+            row = np.full(len(self.columns), np.nan)
+        if measurement is None:
+            warnings.warn(
+                SchemaDriftWarning(path, self.scan_type, "missing", [self.section]),
+                stacklevel=2,
+            )
+            return row
+        missing = []
+        unknown = []
+        invalid = []
+        for group_path, offsets, first_child in self._groups:
+            group = measurement.find(group_path)
+            if group is None:
+                missing.append(group_path)
+                continue
+            found = 0
+            for element in group:
+                offset = offsets.get(element.tag)
+                if offset is None:
+                    unknown.append(group_path + "/" + element.tag)
+                    continue
+                found += 1
+                if first_child and len(element) == 0:
+                    missing.append(group_path + "/" + element.tag + "/*")
+                    continue
+                text = element[0].text if first_child else element.text
+                if text is None or text == "":
+                    continue
+                try:
+                    row[offset] = float(text)
+                except ValueError:
+                    invalid.append(group_path + "/" + element.tag)
+            if found != len(offsets):
+                present = {element.tag for element in group}
+                missing.extend(
+                    group_path + "/" + tag for tag in offsets if tag not in present
+                )
+        unknown.extend(el.tag for el in measurement if el.tag not in self._top_tags)
+
+        for kind, tags in [("missing", missing), ("unknown", unknown), ("invalid", invalid)]:
+            if tags:
+                warnings.warn(
+                    SchemaDriftWarning(path, self.scan_type, kind, tags), stacklevel=2
+                )
+        return row
+
+
+@lru_cache(maxsize=None)
+def get_extractor(scan_type, laterality) -> CompiledExtractor:
+    """
+    Returns the compiled extractor of a scan type and laterality, compiled on first use.
+    """
+    return CompiledExtractor(scan_type, laterality)